@@ -0,0 +1,42 @@
+"""Per-request header cost with 40 headers, as sent by a CDN.
+
+Compares decoding every header into a dict (the old Request.headers) with
+the lazy Headers view when a handler reads two of them.
+Run with: python examples/bench_headers.py
+"""
+import timeit
+
+from nebula.request import Headers
+
+ITERATIONS = 100_000
+
+RAW = [(f"x-cdn-header-{i}".encode(), f"value-{i}".encode()) for i in range(36)] + [
+    (b"host", b"example.com"),
+    (b"cookie", b"nebula_session=abc.def"),
+    (b"authorization", b"Bearer token"),
+    (b"accept-encoding", b"gzip, br"),
+]
+
+
+def eager():
+    headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in RAW}
+    return headers.get("cookie"), headers.get("authorization")
+
+
+def lazy():
+    headers = Headers(RAW)
+    return headers.get("cookie"), headers.get("authorization")
+
+
+def main():
+    assert eager() == lazy()
+
+    old = timeit.timeit(eager, number=ITERATIONS)
+    new = timeit.timeit(lazy, number=ITERATIONS)
+
+    print(f"{'dict of all headers':>22}: {old / ITERATIONS * 1e6:.2f} us")
+    print(f"{'lazy Headers view':>22}: {new / ITERATIONS * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
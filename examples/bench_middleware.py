@@ -0,0 +1,91 @@
+"""Per-request middleware cost with 5 global middlewares.
+
+Compares the precompiled chains against rebuilding them on every request
+(the previous behaviour). Run with:
+python examples/bench_middleware.py
+"""
+import asyncio
+import time
+import tracemalloc
+
+from nebula import Nebula
+from nebula.middleware import Middleware, BaseMiddleware
+
+REQUESTS = 5_000
+MIDDLEWARE_COUNT = 5
+
+
+class PassMiddleware(BaseMiddleware):
+    built = 0
+
+    def __init__(self, app):
+        super().__init__(app)
+        PassMiddleware.built += 1
+
+
+def make_app() -> Nebula:
+    app = Nebula(
+        make_current=False,
+        middlewares=[Middleware(PassMiddleware) for _ in range(MIDDLEWARE_COUNT)],
+    )
+
+    @app.get("/")
+    async def home():
+        return "ok"
+
+    return app
+
+
+SCOPE = {
+    "type": "http",
+    "method": "GET",
+    "path": "/",
+    "query_string": b"",
+    "headers": [],
+}
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def run(app: Nebula, rebuild: bool) -> tuple[float, int, float]:
+    route = app.routes[0]
+
+    PassMiddleware.built = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    for _ in range(REQUESTS):
+        if rebuild:
+            # emulate building the chains per request: the global middlewares
+            # around routing and the route's own stack
+            app._dispatch_app = None
+            route.compiled_app = None
+        await app(dict(SCOPE), receive, send)
+
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed / REQUESTS * 1e6, PassMiddleware.built, peak / 1024
+
+
+async def main():
+    app = make_app()
+    await app(dict(SCOPE), receive, send)  # warm up
+
+    for label, rebuild in (("rebuilt per request", True), ("compiled once", False)):
+        per_request, built, peak = await run(app, rebuild)
+        print(
+            f"{label:>20}: {per_request:7.2f} us/request, "
+            f"{built / REQUESTS:5.2f} middleware objects/request, peak {peak:8.1f} KiB"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
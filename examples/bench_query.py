@@ -0,0 +1,44 @@
+"""Query string parsing: Nebula's parser vs urllib.parse.parse_qsl.
+
+Both percent-decode keys and values; parse_qsl returns a list of pairs,
+Nebula a MultiDict ready for lookups. Run with: python examples/bench_query.py
+"""
+import timeit
+from urllib.parse import parse_qsl, urlencode
+
+from nebula.request import parse_query_string
+
+PAIR_COUNTS = [10, 100, 1000]
+ITERATIONS = 2_000
+
+
+def make_query(count: int, encoded: bool) -> str:
+    if encoded:
+        pairs = [(f"key{i}", f"välue {i}/&=") for i in range(count)]
+    else:
+        pairs = [(f"key{i}", f"value{i}") for i in range(count)]
+    return urlencode(pairs)
+
+
+def main():
+    print(f"{'pairs':>6} | {'encoded':>7} | {'nebula (us)':>12} | {'parse_qsl (us)':>14}")
+    print("-" * 50)
+
+    for count in PAIR_COUNTS:
+        for encoded in (False, True):
+            raw = make_query(count, encoded)
+            assert dict(parse_qsl(raw, keep_blank_values=True)) == dict(parse_query_string(raw))
+
+            ours = timeit.timeit(lambda: parse_query_string(raw), number=ITERATIONS)
+            stdlib = timeit.timeit(
+                lambda: parse_qsl(raw, keep_blank_values=True, max_num_fields=1000), number=ITERATIONS
+            )
+
+            print(
+                f"{count:>6} | {str(encoded):>7} | {ours / ITERATIONS * 1e6:>12.2f} | "
+                f"{stdlib / ITERATIONS * 1e6:>14.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Route lookup latency vs number of registered routes.
+
+Compares the radix-tree Router against the old linear scan over
+Route.match. Run with: python examples/bench_router.py
+"""
+import timeit
+
+from nebula.routing import Route, Router
+
+ROUTE_COUNTS = [10, 100, 1000, 5000]
+ITERATIONS = 20_000
+
+
+def handler(item_id: int):
+    return item_id
+
+
+def linear_lookup(routes, path, method):
+    for route in routes:
+        values = route.match(path, method)
+        if values is not None:
+            return route, values
+    return None, {}
+
+
+def main():
+    print(f"{'routes':>8} | {'router (us)':>12} | {'linear (us)':>12}")
+    print("-" * 38)
+
+    for count in ROUTE_COUNTS:
+        routes = [Route(f"/r{i}/items/{{item_id:int}}", "GET", handler) for i in range(count)]
+        router = Router(routes)
+
+        # Worst case for the linear scan: the last registered route
+        path = f"/r{count - 1}/items/42"
+
+        tree = timeit.timeit(lambda: router.resolve(path, "GET"), number=ITERATIONS)
+        linear = timeit.timeit(lambda: linear_lookup(routes, path, "GET"), number=ITERATIONS // 20)
+
+        print(
+            f"{count:>8} | {tree / ITERATIONS * 1e6:>12.2f} | "
+            f"{linear / (ITERATIONS // 20) * 1e6:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -43,13 +43,13 @@ async def index():
 
 @app.route("/login", methods=["GET", "POST"])
 async def login(request: Request):
-    if request.user.is_authenticated:
+    if (await request.get_user()).is_authenticated:
         return RedirectResponse("/chat")
 
     if request.method == "POST":
         form = await request.form()
-        username = form.get("username", "")[0].strip()
-        password = form.get("password", "")[0]
+        username = form.get("username", "").strip()
+        password = form.get("password", "")
 
         if USERS.get(username) == password:
             request.session[SecureCookieSessionManager._USER_ID_KEY] = User(username).get_id()
@@ -68,10 +68,11 @@ async def logout(request: Request):
 
 @app.get("/chat")
 async def chat(request: Request):
-    if not request.user.is_authenticated:
+    user = await request.get_user()
+    if not user.is_authenticated:
         return RedirectResponse("/login")
 
-    return await app.render_template_async("chat_auth.html", username=request.user.username)
+    return await app.render_template_async("chat_auth.html", username=user.username)
 
 @app.on_connect()
 async def on_connect(sid, environ):
@@ -2,7 +2,7 @@ from .server import Nebula , run_dev, run_prod, get_request, has_request, reques
 from .exceptions import TemplateNotFound, InvalidMethod, DuplicateEndpoint, RouteNotFound
 from .types import AVAILABLE_METHODS
 
-from .session import SecureCookieSessionManager, Session, UserMixin, AnonymousUser
+from .session import SecureCookieSessionManager, ServerSideSessionManager, ServerSideSession, Session, UserMixin, AnonymousUser
 
 __all__ = [
     "Nebula",
@@ -17,6 +17,8 @@ __all__ = [
     "run_dev",
     "run_prod",
     "SecureCookieSessionManager",
+    "ServerSideSessionManager",
+    "ServerSideSession",
     "get_request",
     "has_request",
     "request",
@@ -1,75 +1,494 @@
 import functools
+import hashlib
+import inspect
+import pickle
+import sqlite3
+import threading
 import time # Import time module for timestamp
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+import orjson
+
+from .concurrency import SingleFlight
+
+MISSING = object()  # sentinel so None can be cached like any other value
+
+
+class CacheBackend:
+    """Storage interface behind `Cache`.
+
+    Implementations must be safe to call from the event loop and from the
+    sync handler thread pool at the same time. ``blocking`` backends do I/O
+    per call, so callers that can should use them from the thread pool.
+    """
+
+    blocking = True
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: Hashable) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def sweep(self) -> int:
+        """Drop expired entries, return how many were removed."""
+        return 0
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """In-process store with a capacity limit and LRU or LFU eviction.
+
+    Expiry uses time.monotonic(), so wall clock jumps never expire or
+    resurrect entries. Expired entries are dropped when read and by
+    `Cache.start_sweeper()`.
+    """
+
+    blocking = False
+
+    def __init__(self, max_size: Optional[int] = 1024, policy: str = "lru", clock: Callable[[], float] = time.monotonic):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy: {policy}")
+
+        self.max_size = max_size
+        self.policy = policy
+        self._clock = clock
+        self._lock = threading.RLock()
+
+        # key -> [value, expires_at, frequency]
+        self._data: "OrderedDict[Hashable, list]" = OrderedDict()
+        # LFU bookkeeping: frequency -> keys in insertion order, for O(1) eviction
+        self._freqs: Dict[int, "OrderedDict[Hashable, None]"] = {}
+        self._min_freq = 0
+
+    def _touch(self, key: Hashable, entry: list) -> None:
+        if self.policy == "lru":
+            self._data.move_to_end(key)
+            return
+
+        freq = entry[2]
+        bucket = self._freqs[freq]
+        del bucket[key]
+        if not bucket:
+            del self._freqs[freq]
+            if self._min_freq == freq:
+                self._min_freq = freq + 1
+        entry[2] = freq + 1
+        self._freqs.setdefault(freq + 1, OrderedDict())[key] = None
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._data.pop(key)
+        if self.policy == "lfu":
+            bucket = self._freqs[entry[2]]
+            del bucket[key]
+            if not bucket:
+                del self._freqs[entry[2]]
+
+    def _evict_one(self) -> None:
+        if self.policy == "lru":
+            self._data.popitem(last=False)
+            return
+
+        if self._min_freq not in self._freqs:
+            self._min_freq = min(self._freqs)
+        key = next(iter(self._freqs[self._min_freq]))
+        self._remove(key)
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+
+            expires_at = entry[1]
+            if expires_at is not None and self._clock() >= expires_at:
+                self._remove(key)
+                return default
+
+            self._touch(key, entry)
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = self._clock() + ttl if ttl is not None else None
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                entry[0] = value
+                entry[1] = expires_at
+                self._touch(key, entry)
+                return
+
+            if self.max_size is not None and self.max_size > 0:
+                while len(self._data) >= self.max_size:
+                    self._evict_one()
+
+            self._data[key] = [value, expires_at, 1]
+            if self.policy == "lfu":
+                self._freqs.setdefault(1, OrderedDict())[key] = None
+                self._min_freq = 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._freqs.clear()
+            self._min_freq = 0
+
+    def sweep(self) -> int:
+        now = self._clock()
+        with self._lock:
+            expired = [
+                key for key, (_, expires_at, _) in self._data.items()
+                if expires_at is not None and now >= expires_at
+            ]
+            for key in expired:
+                self._remove(key)
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def _storage_key(key: Hashable) -> str:
+    """Stable text form of a key for backends that store outside the process."""
+    if isinstance(key, str):
+        return key
+    return hashlib.blake2b(pickle.dumps(key, protocol=4), digest_size=16).hexdigest()
+
+
+class SQLiteBackend(CacheBackend):
+    """Cache shared by every worker process on the host via one SQLite file.
+
+    Values are pickled. Expiry uses wall-clock time because monotonic clocks
+    are not comparable across processes.
+    """
+
+    def __init__(self, path: str = "nebula_cache.sqlite3", max_size: Optional[int] = None):
+        self.path = path
+        self.max_size = max_size
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        conn = self._connect()
+        skey = _storage_key(key)
+        now = time.time()
+
+        row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (skey,)).fetchone()
+        if row is None:
+            return default
+
+        value, expires_at = row
+        if expires_at is not None and now >= expires_at:
+            conn.execute("DELETE FROM cache WHERE key = ?", (skey,))
+            return default
+
+        conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, skey))
+        return pickle.loads(value)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        conn = self._connect()
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (_storage_key(key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), expires_at, now),
+        )
+
+        if self.max_size is not None:
+            # Least recently accessed rows go first
+            conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,),
+            )
+
+    def delete(self, key: Hashable) -> None:
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (_storage_key(key),))
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM cache")
+
+    def sweep(self) -> int:
+        cursor = self._connect().execute(
+            "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+        )
+        return cursor.rowcount
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class RedisBackend(CacheBackend):
+    """Store entries in Redis, or in anything speaking its client API.
+
+    ``client`` can be a ``redis.Redis`` instance pointed at a local server or
+    a stand-in such as ``fakeredis.FakeRedis``; only get / set(ex=) / delete /
+    scan_iter are used. Values are pickled, keys are namespaced by ``prefix``
+    and TTLs are enforced by Redis itself.
+    """
+
+    def __init__(self, client, prefix: str = "nebula:cache:"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, key: Hashable) -> str:
+        return self.prefix + _storage_key(key)
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        raw = self.client.get(self._key(key))
+        if raw is None:
+            return default
+        return pickle.loads(raw)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        px = int(ttl * 1000) if ttl is not None else None
+        self.client.set(self._key(key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), px=px)
+
+    def delete(self, key: Hashable) -> None:
+        self.client.delete(self._key(key))
+
+    def clear(self) -> None:
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*"))
+
 
 class Cache:
     """
-    A simple in-memory cache with optional TTL (Time-To-Live).
+    Cache front-end with optional TTL (Time-To-Live), backed by a pluggable
+    `CacheBackend` (in-process `MemoryBackend` by default).
     """
-    def __init__(self):
-        self._cache = {}
+    def __init__(self, backend: Optional[CacheBackend] = None):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self._sweeper: Optional[threading.Thread] = None
+        self._sweeper_stop = threading.Event()
 
-    def get(self, key):
+    def get(self, key, default=None):
         """
         Retrieve an item from the cache.
-        Returns the value if not expired, else None.
+        Returns the value if present and not expired, else `default`.
         """
-        item = self._cache.get(key)
-        if item is None:
-            return None
-
-        value, expiry_timestamp = item
-        if expiry_timestamp is not None and time.time() > expiry_timestamp:
-            self.delete(key) # Delete expired item
-            return None
-        return value
+        return self.backend.get(key, default)
 
     def set(self, key, value, ttl=None):
         """
         Store an item in the cache with an optional TTL.
         `ttl` is in seconds. If None, the item does not expire.
         """
-        expiry_timestamp = time.time() + ttl if ttl is not None else None
-        self._cache[key] = (value, expiry_timestamp)
+        self.backend.set(key, value, ttl)
 
     def clear(self):
         """
         Clear all items from the cache.
         """
-        self._cache.clear()
+        self.backend.clear()
 
     def delete(self, key):
         """
         Delete a specific item from the cache.
         """
-        if key in self._cache:
-            del self._cache[key]
+        self.backend.delete(key)
+
+    def sweep(self) -> int:
+        """
+        Remove every expired item now.
+        """
+        return self.backend.sweep()
+
+    def start_sweeper(self, interval: float = 60.0) -> None:
+        """
+        Remove expired items every `interval` seconds in a daemon thread, so
+        keys that are never read again do not stay in memory.
+        """
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+
+        self._sweeper_stop.clear()
+
+        def run():
+            while not self._sweeper_stop.wait(interval):
+                self.backend.sweep()
+
+        self._sweeper = threading.Thread(target=run, name="nebula-cache-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        self._sweeper_stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+            self._sweeper = None
+
+    def __len__(self) -> int:
+        return len(self.backend)
 
 cache = Cache()
+_default_cache = cache  # `cached(cache=...)` shadows the module-level name
+
+_SCALARS = (str, bytes, int, float, bool, type(None))
+_INLINE_LIMIT = 256  # longer str / bytes are kept in keys only as a digest
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _freeze(value: Any) -> Hashable:
+    """Turn one argument into a compact, type-tagged, hashable key part.
+
+    The type tag keeps ``1``, ``"1"``, ``1.0`` and ``True`` apart. Containers
+    are frozen recursively. Values that are neither scalars nor containers
+    and are not hashable, as well as long strings, are replaced by a blake2b
+    digest of their orjson (or pickle) serialisation.
+    """
+    cls = type(value)
+    if cls in _SCALARS:
+        if cls in (str, bytes) and len(value) > _INLINE_LIMIT:
+            data = value.encode("utf-8", "surrogatepass") if cls is str else value
+            return (cls, "#", _digest(data))
+        return (cls, value)
+
+    if cls is tuple:
+        return (tuple, tuple(_freeze(item) for item in value))
+    if cls is frozenset:
+        return (frozenset, frozenset(_freeze(item) for item in value))
+
+    try:
+        hash(value)
+    except TypeError:
+        pass
+    else:
+        return (cls, value)
+
+    try:
+        data = orjson.dumps(value, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        try:
+            data = pickle.dumps(value, protocol=4)
+        except Exception:
+            raise TypeError(f"Cannot build a cache key from {cls.__name__!r}; pass key= to cached()") from None
+    return (cls, "#", _digest(data))
+
+
+def _make_key(prefix: tuple, args: tuple, kwargs: dict) -> tuple:
+    # Create a cache key from the function's identity and its arguments
+    key = prefix + tuple(_freeze(arg) for arg in args)
+    if kwargs:
+        key += tuple((name, _freeze(kwargs[name])) for name in sorted(kwargs))
+    return key
 
-def cached(ttl=None):
+def cached(
+    ttl=None,
+    cache: Optional[Cache] = None,
+    key: Optional[Callable[..., Hashable]] = None,
+    vary_on: Optional[Iterable[str]] = None,
+):
     """
     A decorator to cache the results of a function.
     The cache key is generated from the function's arguments.
-    
+
+    Works on both plain and `async def` functions. For coroutines, concurrent
+    calls that miss on the same key share a single computation.
+
     Args:
         ttl (int, optional): Time-To-Live in seconds. If None, cache never expires.
                              Defaults to None.
+        cache (Cache, optional): Cache to store results in. Defaults to the
+                                 global `nebula.cache.cache`.
+        key (callable, optional): Called with the function's arguments, returns
+                                  the hashable part of the key to use instead.
+        vary_on (iterable of str, optional): Only these parameters (by name)
+                                             make up the key; others are ignored.
     """
+    store = cache if cache is not None else _default_cache
+    if key is not None and vary_on is not None:
+        raise ValueError("cached() accepts either key= or vary_on=, not both")
+
     def decorator(func):
+        prefix = (func.__module__, func.__qualname__)
+
+        if key is not None:
+            def make_key(args, kwargs):
+                return prefix + (_freeze(key(*args, **kwargs)),)
+        elif vary_on is not None:
+            signature = inspect.signature(func)
+            names = tuple(vary_on)
+            unknown = [name for name in names if name not in signature.parameters]
+            if unknown:
+                raise ValueError(f"vary_on names unknown parameters of {func.__qualname__}: {unknown}")
+
+            def make_key(args, kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                arguments = bound.arguments
+                return prefix + tuple(_freeze(arguments[name]) for name in names)
+        else:
+            def make_key(args, kwargs):
+                return _make_key(prefix, args, kwargs)
+
+        if inspect.iscoroutinefunction(func):
+            flight = SingleFlight()
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                cache_key = make_key(args, kwargs)
+
+                result = store.backend.get(cache_key, MISSING)
+                if result is not MISSING:
+                    return result
+
+                # Single flight: later callers await the first caller's result
+                return await flight.do(
+                    cache_key,
+                    lambda: func(*args, **kwargs),
+                    lambda value: store.set(cache_key, value, ttl=ttl),
+                )
+
+            return async_wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            # Create a cache key from the function's name and its arguments
-            key_parts = [func.__module__, func.__name__]
-            key_parts.extend(str(arg) for arg in args)
-            key_parts.extend(f"{k}={v}" for k, v in sorted(kwargs.items()))
-            cache_key = ":".join(key_parts)
-
-            result = cache.get(cache_key)
-            if result is not None:
+            cache_key = make_key(args, kwargs)
+
+            result = store.backend.get(cache_key, MISSING)
+            if result is not MISSING:
                 return result
-            
+
             result = func(*args, **kwargs)
-            cache.set(cache_key, result, ttl=ttl)
+            store.set(cache_key, result, ttl=ttl)
             return result
         return wrapper
     return decorator
@@ -0,0 +1,164 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+
+class ThreadPool:
+    """Bounded worker pool for synchronous handlers, loaders and error handlers.
+
+    Blocking sync code runs here instead of on the event loop. The current
+    contextvars (request, app) are copied into the worker, so get_request()
+    and current_app keep working inside sync handlers.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, thread_name_prefix: str = "nebula-sync"):
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.thread_name_prefix = thread_name_prefix
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        # The loop submitting work, so workers can hand coroutines back to it
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Counters behind get_stats(), touched from both the loop and workers
+        self._submitted = 0
+        self._started = 0
+        self._completed = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # Created lazily so apps without sync handlers never spawn threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix=self.thread_name_prefix,
+            )
+        return self._executor
+
+    @property
+    def queued(self) -> int:
+        """Calls submitted but not yet picked up by a worker."""
+        return self._submitted - self._started
+
+    @property
+    def active(self) -> int:
+        """Calls currently running in a worker."""
+        return self._started - self._completed
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self._submitted - self._started,
+                "active": self._started - self._completed,
+                "completed": self._completed,
+            }
+
+    def _call(self, ctx: contextvars.Context, func: Callable, args: tuple, kwargs: dict) -> Any:
+        with self._lock:
+            self._started += 1
+        try:
+            return ctx.run(func, *args, **kwargs)
+        finally:
+            with self._lock:
+                self._completed += 1
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run ``func(*args, **kwargs)`` in a worker thread and await the result."""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+
+        with self._lock:
+            self._submitted += 1
+        self.loop = loop
+
+        return await loop.run_in_executor(
+            self.executor, functools.partial(self._call, ctx, func, args, kwargs)
+        )
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+class SingleFlight:
+    """Share one in-progress async call per key between concurrent callers.
+
+    The first caller for a key runs ``func``; callers arriving while it runs
+    await its result (or exception). If that first caller is cancelled, its
+    cancellation is not handed to the others: they retry and one of them
+    runs ``func`` itself.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Any, asyncio.Future] = {}
+
+    async def do(self, key: Any, func: Callable[[], Any], store: Optional[Callable[[Any], None]] = None) -> Any:
+        """Return ``await func()``, shared with concurrent calls for ``key``.
+
+        ``store(result)`` runs only if the call wasn't forget()-ten meanwhile,
+        so an invalidated call never writes back a stale result.
+        """
+        while True:
+            pending = self._calls.get(key)
+            if pending is None:
+                break
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                task = asyncio.current_task()
+                cancelling = task.cancelling() if hasattr(task, "cancelling") else 0
+                if not pending.cancelled() or cancelling:
+                    raise  # this caller was cancelled, not the one it waited on
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            # Waiters retry instead of inheriting this caller's cancellation
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark retrieved so a call without waiters doesn't warn
+            future.exception()
+            raise
+        else:
+            if store is not None and self._calls.get(key) is future:
+                store(result)
+            future.set_result(result)
+            return result
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def forget(self, key: Any) -> None:
+        """Detach the in-progress call for ``key``; later callers start a new one."""
+        self._calls.pop(key, None)
+
+
+_STOP = object()
+
+
+async def run_in_threadpool(func: Callable, *args, **kwargs) -> Any:
+    """Run ``func`` in the loop's default executor, for code without an app pool."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(None, functools.partial(ctx.run, func, *args, **kwargs))
+
+
+async def iterate_in_threadpool(iterator: Iterator, pool: Optional[ThreadPool] = None) -> AsyncIterator:
+    """Drive a blocking iterator from async code, one ``next()`` per worker hop."""
+    run = pool.run if pool is not None else run_in_threadpool
+
+    while True:
+        item = await run(next, iterator, _STOP)
+        if item is _STOP:
+            break
+        yield item
@@ -35,4 +35,19 @@ class HTTPException(Exception):
     def __init__(self, status_code: int, body: str = ""):
         self.status_code = status_code
         
-        super().__init__(body)
\ No newline at end of file
+        super().__init__(body)
+
+class PayloadTooLarge(HTTPException):
+    """Raised when a request body exceeds the configured size limit."""
+    def __init__(self, body: str = "Request body too large."):
+        super().__init__(413, body)
+
+class MultiPartParseError(HTTPException):
+    """Raised when a multipart/form-data body is malformed."""
+    def __init__(self, body: str = ""):
+        super().__init__(400, body)
+
+class TooManyParameters(HTTPException):
+    """Raised when a query string or form body has more pairs than allowed."""
+    def __init__(self, body: str = ""):
+        super().__init__(400, body)
@@ -0,0 +1,304 @@
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterator, Dict, Optional, Tuple, Union
+from urllib.parse import unquote
+
+from .concurrency import run_in_threadpool
+from .exceptions import MultiPartParseError, PayloadTooLarge
+
+# Limits applied by Request.form(); each can be overridden per call
+DEFAULT_SPOOL_SIZE = 1024 * 1024  # bigger uploads move from RAM to a temp file
+DEFAULT_MAX_FIELD_SIZE = 1024 * 1024  # plain fields are always held in memory
+DEFAULT_MAX_FILE_SIZE = 100 * 1024 * 1024
+DEFAULT_MAX_TOTAL_SIZE = 200 * 1024 * 1024
+DEFAULT_MAX_PARTS = 1000
+
+_MAX_HEADER_SIZE = 16 * 1024
+
+
+class UploadFile:
+    """A file part of a multipart/form-data body.
+
+    The content lives in a SpooledTemporaryFile: in memory up to
+    ``max_memory`` bytes, on disk beyond that. Once on disk, reads and
+    writes run in a worker thread.
+    """
+
+    __slots__ = ("filename", "content_type", "headers", "file", "size")
+
+    def __init__(
+        self,
+        filename: str,
+        content_type: str = "application/octet-stream",
+        headers: Optional[Dict[str, str]] = None,
+        max_memory: int = DEFAULT_SPOOL_SIZE,
+    ):
+        self.filename = filename
+        self.content_type = content_type
+        self.headers = headers or {}
+        self.file = SpooledTemporaryFile(max_size=max_memory)
+        self.size = 0
+
+    @property
+    def in_memory(self) -> bool:
+        return not getattr(self.file, "_rolled", True)
+
+    async def write(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.in_memory:
+            self.file.write(data)
+        else:
+            await run_in_threadpool(self.file.write, data)
+
+    async def read(self, size: int = -1) -> bytes:
+        if self.in_memory:
+            return self.file.read(size)
+        return await run_in_threadpool(self.file.read, size)
+
+    async def seek(self, offset: int) -> None:
+        if self.in_memory:
+            self.file.seek(offset)
+        else:
+            await run_in_threadpool(self.file.seek, offset)
+
+    async def close(self) -> None:
+        if self.in_memory:
+            self.file.close()
+        else:
+            await run_in_threadpool(self.file.close)
+
+    def __repr__(self) -> str:
+        return f"UploadFile(filename={self.filename!r}, content_type={self.content_type!r}, size={self.size})"
+
+
+def parse_options_header(value: str) -> Tuple[str, Dict[str, str]]:
+    """``'form-data; name="a"; filename="b.txt"'`` -> ``("form-data", {"name": "a", "filename": "b.txt"})``."""
+    main, _, rest = value.partition(";")
+    params: Dict[str, str] = {}
+
+    i, n = 0, len(rest)
+    while i < n:
+        eq = rest.find("=", i)
+        if eq == -1:
+            break
+        key = rest[i:eq].strip().strip(";").strip().lower()
+        i = eq + 1
+
+        if i < n and rest[i] == '"':
+            # Quoted string, backslash escapes the next character
+            i += 1
+            chars = []
+            while i < n and rest[i] != '"':
+                if rest[i] == "\\" and i + 1 < n:
+                    i += 1
+                chars.append(rest[i])
+                i += 1
+            val = "".join(chars)
+            i = rest.find(";", i)
+            i = n if i == -1 else i + 1
+        else:
+            end = rest.find(";", i)
+            end = n if end == -1 else end
+            val = rest[i:end].strip()
+            i = end + 1
+
+        if key.endswith("*"):
+            # RFC 5987: charset'lang'percent-encoded
+            charset, _, encoded = val.partition("'")
+            _, _, encoded = encoded.partition("'")
+            key = key[:-1]
+            val = unquote(encoded, encoding=charset or "utf-8", errors="replace")
+        elif key in params:
+            continue  # an earlier filename* wins over the plain form
+
+        if key:
+            params[key] = val
+
+    return main.strip().lower(), params
+
+
+class MultiPartParser:
+    """Incremental multipart/form-data parser over a stream of body chunks.
+
+    Iterating ``parse()`` yields ``(name, value)`` pairs as soon as each part
+    is complete: ``value`` is a ``str`` for plain fields and an
+    ``UploadFile`` (rewound to the start) for file parts. Only the current
+    part's pending bytes are buffered; file contents are spooled as they
+    arrive. Oversized parts or bodies raise PayloadTooLarge (413), malformed
+    bodies MultiPartParseError (400).
+    """
+
+    def __init__(
+        self,
+        content_type: str,
+        stream: AsyncIterator[bytes],
+        spool_size: int = DEFAULT_SPOOL_SIZE,
+        max_field_size: int = DEFAULT_MAX_FIELD_SIZE,
+        max_file_size: Optional[int] = DEFAULT_MAX_FILE_SIZE,
+        max_total_size: Optional[int] = DEFAULT_MAX_TOTAL_SIZE,
+        max_parts: int = DEFAULT_MAX_PARTS,
+    ):
+        _, params = parse_options_header(content_type)
+        boundary = params.get("boundary")
+        if not boundary:
+            raise MultiPartParseError("Missing boundary in multipart/form-data content type.")
+
+        self.boundary = boundary.encode("latin-1")
+        self.stream = stream
+        self.spool_size = spool_size
+        self.max_field_size = max_field_size
+        self.max_file_size = max_file_size
+        self.max_total_size = max_total_size
+        self.max_parts = max_parts
+
+    async def parse(self) -> AsyncIterator[Tuple[str, Union[str, UploadFile]]]:
+        # A leading CRLF makes the first boundary look like every other one
+        delimiter = b"\r\n--" + self.boundary
+        keep = len(delimiter) + 1
+        buffer = bytearray(b"\r\n")
+        total = 0
+        parts = 0
+
+        state = "preamble"
+        name = ""
+        charset = "utf-8"
+        field: Optional[bytearray] = None
+        upload: Optional[UploadFile] = None
+        part_size = 0
+        finished = False
+
+        async for chunk in self.stream:
+            total += len(chunk)
+            if self.max_total_size is not None and total > self.max_total_size:
+                await self._discard(upload)
+                raise PayloadTooLarge()
+            buffer += chunk
+
+            while not finished:
+                if state == "preamble":
+                    idx = buffer.find(delimiter)
+                    if idx == -1:
+                        # Preamble is ignored, only keep what may start a boundary
+                        del buffer[: max(0, len(buffer) - keep)]
+                        break
+                    del buffer[: idx + len(delimiter)]
+                    state = "after_boundary"
+
+                elif state == "after_boundary":
+                    if len(buffer) < 2:
+                        break
+                    if buffer[:2] == b"--":
+                        finished = True
+                        break
+                    # Transport padding before the CRLF is allowed
+                    eol = buffer.find(b"\r\n")
+                    if eol == -1:
+                        if len(buffer) > _MAX_HEADER_SIZE:
+                            raise MultiPartParseError("Malformed multipart boundary line.")
+                        break
+                    del buffer[: eol + 2]
+                    state = "headers"
+
+                elif state == "headers":
+                    if buffer[:2] == b"\r\n":
+                        end = -2  # part without any headers
+                    else:
+                        end = buffer.find(b"\r\n\r\n")
+                    if end == -1:
+                        if len(buffer) > _MAX_HEADER_SIZE:
+                            raise MultiPartParseError("Multipart part headers too large.")
+                        break
+
+                    parts += 1
+                    if parts > self.max_parts:
+                        await self._discard(upload)
+                        raise PayloadTooLarge(f"Too many multipart parts (max {self.max_parts}).")
+
+                    headers = self._parse_headers(bytes(buffer[: max(end, 0)]))
+                    del buffer[: end + 4]
+
+                    disposition, options = parse_options_header(headers.get("content-disposition", ""))
+                    if disposition != "form-data" or "name" not in options:
+                        raise MultiPartParseError("Multipart part without a form-data name.")
+
+                    name = options["name"]
+                    content_type = headers.get("content-type", "")
+                    part_size = 0
+                    if "filename" in options:
+                        upload = UploadFile(
+                            options["filename"],
+                            content_type or "application/octet-stream",
+                            headers,
+                            self.spool_size,
+                        )
+                        field = None
+                    else:
+                        _, ct_params = parse_options_header(content_type)
+                        charset = ct_params.get("charset", "utf-8")
+                        field = bytearray()
+                        upload = None
+                    state = "body"
+
+                elif state == "body":
+                    idx = buffer.find(delimiter)
+                    if idx == -1:
+                        # Everything but a possible partial delimiter is part data
+                        size = len(buffer) - keep
+                        if size <= 0:
+                            break
+                        data = bytes(buffer[:size])
+                        del buffer[:size]
+                    else:
+                        data = bytes(buffer[:idx])
+                        del buffer[: idx + len(delimiter)]
+
+                    part_size += len(data)
+                    if upload is not None:
+                        if self.max_file_size is not None and part_size > self.max_file_size:
+                            await self._discard(upload)
+                            raise PayloadTooLarge(f"Uploaded file {upload.filename!r} too large.")
+                        if data:
+                            await upload.write(data)
+                    else:
+                        if part_size > self.max_field_size:
+                            raise PayloadTooLarge(f"Form field {name!r} too large.")
+                        field += data
+
+                    if idx == -1:
+                        break
+
+                    state = "after_boundary"
+                    if upload is not None:
+                        await upload.seek(0)
+                        yield name, upload
+                        upload = None
+                    else:
+                        try:
+                            yield name, field.decode(charset)
+                        except (LookupError, UnicodeDecodeError):
+                            raise MultiPartParseError(f"Form field {name!r} is not valid {charset}.") from None
+                        field = None
+
+            if finished:
+                break
+
+        if not finished:
+            await self._discard(upload)
+            raise MultiPartParseError("Multipart body ended before the closing boundary.")
+
+    @staticmethod
+    def _parse_headers(raw: bytes) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        if not raw:
+            return headers
+        for line in raw.split(b"\r\n"):
+            key, sep, value = line.partition(b":")
+            if not sep:
+                raise MultiPartParseError("Malformed multipart part header.")
+            # Browsers send UTF-8 filenames raw in the header
+            headers[key.strip().decode("latin-1").lower()] = value.strip().decode("utf-8", "replace")
+        return headers
+
+    @staticmethod
+    async def _discard(upload: Optional[UploadFile]) -> None:
+        if upload is not None:
+            await upload.close()
@@ -1,3 +1,16 @@
+import asyncio
+import time
+import zlib
+from urllib.parse import parse_qsl
+
+try:  # optional dependency
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+from .cache import Cache
+
+
 class BaseMiddleware:
     def __init__(self, app):
         self.app = app
@@ -11,4 +24,571 @@ class Middleware:
         self.options = options
 
     def build(self, app):
-        return self.middleware_cls(app, **self.options)
\ No newline at end of file
+        return self.middleware_cls(app, **self.options)
+
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/xhtml+xml",
+    "application/rss+xml",
+    "application/atom+xml",
+    "application/manifest+json",
+    "image/svg+xml",
+)
+
+
+def available_encodings() -> tuple:
+    """Content codings this process can produce, preferred first."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding: str, available: tuple) -> str | None:
+    """Pick the first of ``available`` the client accepts with q > 0."""
+    if not accept_encoding:
+        return None
+
+    accepted: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+
+    wildcard = accepted.get("*", 0.0)
+    for coding in available:
+        if accepted.get(coding, wildcard) > 0:
+            return coding
+
+    return None
+
+
+class _Compressor:
+    """Streaming gzip / brotli compressor, flushed after every chunk."""
+
+    __slots__ = ("_obj", "_brotli")
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self._brotli = encoding == "br"
+        if self._brotli:
+            self._obj = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._obj = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        # Sync flush keeps streamed chunks moving instead of buffering them
+        if self._brotli:
+            return self._obj.process(data) + self._obj.flush()
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self._brotli:
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+class CompressionMiddleware(BaseMiddleware):
+    """Compress response bodies based on the request's Accept-Encoding.
+
+    Single-message bodies are compressed only above ``minimum_size``.
+    Streamed bodies (``more_body=True``) are compressed chunk by chunk
+    without buffering. Responses that already carry a Content-Encoding,
+    non-200 responses and non-text content types pass through untouched.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 500,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        compressible_types: tuple = COMPRESSIBLE_TYPES,
+    ):
+        super().__init__(app)
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.compressible_types = compressible_types
+        self.encodings = available_encodings()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        accept_encoding = b""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value
+                break
+
+        encoding = negotiate_encoding(accept_encoding.decode("latin-1"), self.encodings)
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+
+            msg_type = message["type"]
+
+            if msg_type == "http.response.start":
+                # Held back until the first body chunk shows what we're sending
+                start_message = message
+                return
+
+            if passthrough:
+                return await send(message)
+
+            if compressor is not None:
+                if msg_type != "http.response.body":
+                    return await send(message)
+                more_body = message.get("more_body", False)
+                body = compressor.compress(message.get("body", b""))
+                if not more_body:
+                    body += compressor.finish()
+                return await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+            if start_message is None or msg_type != "http.response.body":
+                passthrough = True
+                if start_message is not None:
+                    await send(start_message)
+                return await send(message)
+
+            headers = start_message["headers"]
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if not self._should_compress(start_message["status"], headers) or (
+                not more_body and len(body) < self.minimum_size
+            ):
+                passthrough = True
+                await send(start_message)
+                return await send(message)
+
+            headers = [(k, v) for k, v in headers if k != b"content-length"]
+            headers.append((b"content-encoding", encoding.encode("latin-1")))
+            headers.append((b"vary", b"Accept-Encoding"))
+
+            compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+            body = compressor.compress(body)
+
+            if not more_body:
+                body += compressor.finish()
+                headers.append((b"content-length", str(len(body)).encode("latin-1")))
+
+            start_message = dict(start_message, headers=headers)
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+        # Bodyless responses never reach the body branch above
+        if start_message is not None and not passthrough and compressor is None:
+            await send(start_message)
+
+    def _should_compress(self, status: int, headers) -> bool:
+        if status != 200:
+            return False
+
+        content_type = b""
+        for name, value in headers:
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value
+
+        return content_type.decode("latin-1").startswith(self.compressible_types)
+
+
+_UNCACHEABLE_DIRECTIVES = frozenset(("no-store", "no-cache", "private"))
+_CACHEABLE_STATUSES = frozenset((200, 203, 204, 300, 301, 308, 404, 410))
+_CREDENTIAL_HEADERS = frozenset((b"authorization", b"cookie"))
+
+
+def _parse_cache_control(value: bytes) -> dict:
+    """``b"public, max-age=60"`` -> ``{"public": None, "max-age": "60"}``."""
+    directives = {}
+    for item in value.decode("latin-1").split(","):
+        name, _, arg = item.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') if arg else None
+    return directives
+
+
+def _seconds(value, default=None):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return default
+
+
+class CachedResponse:
+    """A fully encoded response kept by ResponseCacheMiddleware."""
+
+    __slots__ = ("status", "headers", "body", "stored_at", "fresh_for")
+
+    def __init__(self, status: int, headers: list, body: bytes, stored_at: float, fresh_for: float):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.stored_at = stored_at
+        self.fresh_for = fresh_for
+
+
+class ResponseCacheMiddleware(BaseMiddleware):
+    """Serve repeated GET / HEAD requests from stored, fully encoded responses.
+
+    Entries are keyed by path, normalised query string and the values of the
+    request headers the response named in ``Vary``. A hit replays status,
+    headers and body straight from the cache, so the route handler, session
+    and user loading and auto_detect_response() never run.
+
+    Handlers opt in through ``Cache-Control``: only responses marked
+    ``public`` or carrying ``s-maxage`` / ``max-age`` are stored, the latter
+    two setting the lifetime (``ttl`` for a bare ``public``).
+    ``store_unmarked=True`` also stores responses without any
+    ``Cache-Control`` for ``ttl`` seconds. ``no-store``, ``no-cache`` and
+    ``private`` are never stored, and ``stale-while-revalidate`` lets an
+    expired entry be served once more while a background request refreshes
+    it; the refresh is sent without the triggering request's ``Cookie`` and
+    ``Authorization`` headers. Responses that set cookies or ``Vary: *`` are
+    never stored, and neither are responses to requests carrying
+    ``Authorization`` or ``Cookie`` or whose handler opened the session.
+
+    The middleware is rebuilt whenever routes are compiled, so pass a shared
+    ``cache`` to be able to clear entries from outside.
+    """
+
+    def __init__(
+        self,
+        app,
+        cache=None,
+        ttl: float | None = 60,
+        stale_while_revalidate: float = 0,
+        max_body_size: int = 1024 * 1024,
+        store_unmarked: bool = False,
+    ):
+        super().__init__(app)
+
+        self.cache = cache if cache is not None else Cache()
+        self.ttl = ttl
+        self.store_unmarked = store_unmarked
+        self.stale_while_revalidate = stale_while_revalidate
+        self.max_body_size = max_body_size
+        self._refreshing: set = set()
+        # Strong references, the event loop only keeps weak ones to tasks
+        self._refresh_tasks: set = set()
+
+    @staticmethod
+    def _base_key(scope) -> tuple:
+        query_string = scope.get("query_string", b"")
+        if query_string:
+            query = tuple(sorted(parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)))
+        else:
+            query = ()
+        return ("nebula:response", scope.get("root_path", "") + scope["path"], query)
+
+    @staticmethod
+    def _vary_values(scope, vary: tuple) -> tuple:
+        if not vary:
+            return ()
+
+        values = dict.fromkeys(vary, b"")
+        for name, value in scope["headers"]:
+            if name in values:
+                values[name] = value if not values[name] else values[name] + b"," + value
+        return tuple(values[name] for name in vary)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+
+        bypass = False
+        has_cookie = False
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                return await self.app(scope, receive, send)
+            if name == b"cookie":
+                has_cookie = True
+            elif name == b"cache-control" and (
+                b"no-cache" in value or b"no-store" in value or b"max-age=0" in value
+            ):
+                bypass = True
+
+        base_key = self._base_key(scope)
+
+        if not bypass:
+            vary = self.cache.get(base_key + ("vary",))
+            if vary is not None:
+                key = base_key + self._vary_values(scope, vary)
+                entry = self.cache.get(key)
+                if entry is not None:
+                    age = time.time() - entry.stored_at
+                    if age >= entry.fresh_for and key not in self._refreshing:
+                        self._refresh(scope, key, base_key)
+                    return await self._replay(entry, age, scope, send)
+
+        if scope["method"] == "HEAD" or has_cookie:
+            # Bodiless, or possibly personalised: served, never stored
+            return await self.app(scope, receive, send)
+
+        await self._capture(scope, receive, send, base_key)
+
+    async def _replay(self, entry: CachedResponse, age: float, scope, send) -> None:
+        headers = entry.headers + [(b"age", str(int(age)).encode("latin-1"))]
+        await send({"type": "http.response.start", "status": entry.status, "headers": headers})
+        body = b"" if scope["method"] == "HEAD" else entry.body
+        await send({"type": "http.response.body", "body": body, "more_body": False})
+
+    def _refresh(self, scope, key: tuple, base_key: tuple) -> None:
+        self._refreshing.add(key)
+
+        # Revalidate as an anonymous client, whoever hit the stale entry
+        refresh_scope = dict(scope)
+        refresh_scope["headers"] = [
+            (name, value) for name, value in scope["headers"] if name not in _CREDENTIAL_HEADERS
+        ]
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def discard(message):
+            pass
+
+        async def run():
+            # Imported here, server.py imports this module
+            from .request import Request
+            from .server import _current_request, get_request, has_request
+
+            if has_request():
+                # The task copied the caller's context; give the refresh its
+                # own request so nothing of the caller's session leaks in
+                request = Request(refresh_scope, receive, discard)
+                request._app = get_request()._app
+                _current_request.set(request)
+
+            try:
+                await self._capture(refresh_scope, receive, discard, base_key)
+            except Exception:
+                pass  # keep serving the stale entry until it runs out
+            finally:
+                self._refreshing.discard(key)
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _capture(self, scope, receive, send, base_key: tuple) -> None:
+        start_message = None
+        chunks = []
+        size = 0
+        storable = True
+
+        async def send_wrapper(message):
+            nonlocal start_message, size, storable
+
+            if message["type"] == "http.response.start":
+                start_message = message
+            elif message["type"] == "http.response.body" and storable:
+                body = message.get("body", b"")
+                size += len(body)
+                if size > self.max_body_size:
+                    storable = False
+                    chunks.clear()
+                else:
+                    chunks.append(body)
+
+                if not message.get("more_body", False) and storable:
+                    self._store(scope, base_key, start_message, b"".join(chunks))
+
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _store(self, scope, base_key: tuple, start_message, body: bytes) -> None:
+        if start_message is None or start_message["status"] not in _CACHEABLE_STATUSES:
+            return
+
+        for name, _ in scope["headers"]:
+            if name in _CREDENTIAL_HEADERS:
+                # Possibly personalised
+                return
+
+        # Imported here, server.py imports this module
+        from .server import get_request, has_request
+        if has_request() and get_request()._session is not None:
+            # The handler looked at the session, the body may be per user
+            return
+
+        directives = {}
+        vary = []
+        for name, value in start_message["headers"]:
+            if name == b"set-cookie":
+                return
+            if name == b"cache-control":
+                directives.update(_parse_cache_control(value))
+            elif name == b"vary":
+                vary.extend(
+                    part.strip().lower() for part in value.split(b",") if part.strip()
+                )
+
+        if b"*" in vary or _UNCACHEABLE_DIRECTIVES.intersection(directives):
+            return
+
+        if "public" in directives or (self.store_unmarked and not directives):
+            default_ttl = self.ttl
+        else:
+            default_ttl = None
+        fresh_for = _seconds(directives.get("s-maxage"), _seconds(directives.get("max-age"), default_ttl))
+        if fresh_for is None:
+            return
+        stale_for = _seconds(directives.get("stale-while-revalidate"), self.stale_while_revalidate)
+        if fresh_for + stale_for <= 0:
+            return
+
+        vary = tuple(dict.fromkeys(vary))
+        entry = CachedResponse(start_message["status"], list(start_message["headers"]), body, time.time(), fresh_for)
+
+        self.cache.set(base_key + ("vary",), vary, ttl=fresh_for + stale_for)
+        self.cache.set(base_key + self._vary_values(scope, vary), entry, ttl=fresh_for + stale_for)
+
+
+class CORSMiddleware(BaseMiddleware):
+    """Cross-Origin Resource Sharing.
+
+    Preflight requests (OPTIONS with Access-Control-Request-Method) are
+    answered here, before routing to any handler. Unless ``allow_methods``
+    is given, the allowed methods are those actually registered for the
+    path, looked up through ``path_methods(path)`` (wired to
+    ``Nebula.allowed_methods`` by ``app.setup_cors()``). Other requests
+    from an allowed origin get the CORS headers added to their response.
+    """
+
+    def __init__(
+        self,
+        app,
+        allow_origins=("*",),
+        allow_methods=None,
+        allow_headers=(),
+        allow_credentials: bool = False,
+        expose_headers=(),
+        max_age: int = 600,
+        path_methods=None,
+    ):
+        super().__init__(app)
+        self.allow_all_origins = "*" in allow_origins
+        self.allow_origins = frozenset(allow_origins)
+        self.allow_methods = frozenset(m.upper() for m in allow_methods) if allow_methods is not None else None
+        self.allow_all_headers = "*" in allow_headers
+        self.allow_headers = frozenset(h.lower() for h in allow_headers)
+        self.allow_credentials = allow_credentials
+        self.path_methods = path_methods
+
+        # Encoded once, appended as-is to every response
+        simple = []
+        if allow_credentials:
+            simple.append((b"access-control-allow-credentials", b"true"))
+        if expose_headers:
+            simple.append((b"access-control-expose-headers", ", ".join(expose_headers).encode("latin-1")))
+        self._simple_headers = simple
+
+        preflight = list(simple)
+        preflight.append((b"access-control-max-age", str(max_age).encode("latin-1")))
+        if not self.allow_all_headers and allow_headers:
+            preflight.append((b"access-control-allow-headers", ", ".join(sorted(self.allow_headers)).encode("latin-1")))
+        self._preflight_headers = preflight
+
+    def _origin_headers(self, origin: bytes) -> list:
+        # A literal "*" is not allowed together with credentials
+        if self.allow_all_origins and not self.allow_credentials:
+            return [(b"access-control-allow-origin", b"*")]
+        return [(b"access-control-allow-origin", origin), (b"vary", b"Origin")]
+
+    def _is_allowed_origin(self, origin: bytes) -> bool:
+        return self.allow_all_origins or origin.decode("latin-1") in self.allow_origins
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        origin = None
+        request_method = None
+        request_headers = None
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                request_method = value
+            elif name == b"access-control-request-headers":
+                request_headers = value
+
+        if origin is None:
+            return await self.app(scope, receive, send)
+
+        if scope["method"] == "OPTIONS" and request_method is not None:
+            return await self._preflight(scope, send, origin, request_method, request_headers)
+
+        if not self._is_allowed_origin(origin):
+            return await self.app(scope, receive, send)
+
+        extra = self._origin_headers(origin) + self._simple_headers
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=list(message["headers"]) + extra)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _preflight(self, scope, send, origin: bytes, request_method: bytes, request_headers) -> None:
+        if self.allow_methods is not None:
+            methods = self.allow_methods
+        elif self.path_methods is not None:
+            methods = self.path_methods(scope["path"])
+        else:
+            methods = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE"))
+
+        method = request_method.decode("latin-1").upper()
+
+        failures = []
+        if not self._is_allowed_origin(origin):
+            failures.append("origin")
+        if method not in methods:
+            failures.append("method")
+
+        headers = self._preflight_headers + [
+            (b"access-control-allow-methods", ", ".join(sorted(methods)).encode("latin-1")),
+        ]
+
+        if request_headers:
+            if self.allow_all_headers:
+                headers.append((b"access-control-allow-headers", request_headers))
+            else:
+                requested = {h.strip().lower() for h in request_headers.decode("latin-1").split(",") if h.strip()}
+                if not requested <= self.allow_headers:
+                    failures.append("headers")
+
+        if failures:
+            body = f"Disallowed CORS {', '.join(failures)}".encode("utf-8")
+            headers = [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ]
+            status = 400
+        else:
+            headers = self._origin_headers(origin) + headers + [(b"content-length", b"0")]
+            body = b""
+            status = 204
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body, "more_body": False})
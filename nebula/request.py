@@ -1,37 +1,205 @@
 import orjson
-from typing import AsyncGenerator, Callable, Dict, Any, List
-from .exceptions import RequestDisconnected
+from collections.abc import Mapping
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, Any, Iterator, List, Optional, Tuple, Union
+from urllib.parse import unquote, unquote_plus
+from .exceptions import PayloadTooLarge, RequestDisconnected, TooManyParameters
+from .formparsers import MultiPartParser, UploadFile
 
-def _parse_pairs(raw: str) -> "MultiDict":
+DEFAULT_MAX_PAIRS = 1000  # bounds the work an attacker can force per query/form
+
+def parse_query_string(raw: str, max_pairs: int = DEFAULT_MAX_PAIRS, semicolon: bool = False) -> "MultiDict":
     """Parse a key=value&... string into a MultiDict.
 
-    Shared by query_params and form so the logic lives in one place.
+    Shared by query_params and form so the logic lives in one place. Keys and
+    values are percent-decoded (``+`` is a space) once, here; parts without
+    ``%`` or ``+`` skip decoding entirely. With ``semicolon=True`` ``;`` also
+    separates pairs. More than ``max_pairs`` pairs raises TooManyParameters.
     """
     md = MultiDict()
-    for part in raw.split("&"):
-        if "=" in part:
-            k, v = part.split("=", 1)
-            md.add(k, v)
-        elif part:
-            md.add(part, "")
+    if not raw:
+        return md
+
+    if semicolon and ";" in raw:
+        raw = raw.replace(";", "&")
+
+    parts = raw.split("&", max_pairs)
+    if len(parts) > max_pairs:
+        raise TooManyParameters(f"More than {max_pairs} parameters.")
+
+    add = md.add
+    for part in parts:
+        if not part:
+            continue
+        key, _, value = part.partition("=")
+        if "%" in key or "+" in key:
+            key = unquote_plus(key)
+        if "+" in value:
+            value = unquote_plus(value)
+        elif "%" in value:
+            value = unquote(value)
+        add(key, value)
     return md
 
 class MultiDict(dict):
-    """dict subclass that supports multiple values per key."""
+    """dict subclass that supports multiple values per key.
+
+    Indexing and get() return the first value for a key, getlist() all of
+    them. Single-valued keys, the common case, are stored as plain dict
+    entries; a list is only allocated once a key repeats.
+    """
 
-    __slots__ = ()   # no extra instance dict, saves memory for many instances
+    __slots__ = ("_multi",)   # no per-instance __dict__, only the repeated-key lists
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._multi: Dict[str, List[Any]] = {}
 
     def add(self, key: str, value: Any) -> None:
-        if key in self:
-            self[key].append(value)
+        if key not in self:
+            dict.__setitem__(self, key, value)
+            return
+
+        values = self._multi.get(key)
+        if values is None:
+            self._multi[key] = [dict.__getitem__(self, key), value]
         else:
-            self[key] = [value]
+            values.append(value)
 
     def getlist(self, key: str) -> List[Any]:
-        return self.get(key, [])
+        values = self._multi.get(key)
+        if values is not None:
+            return list(values)
+        if key in self:
+            return [dict.__getitem__(self, key)]
+        return []
+
+    def multi_items(self) -> Iterator[Tuple[str, Any]]:
+        """Every (key, value) pair, repeated keys included, in insertion order per key."""
+        multi = self._multi
+        for key, value in dict.items(self):
+            if key in multi:
+                for item in multi[key]:
+                    yield key, item
+            else:
+                yield key, value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._multi.pop(key, None)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key: str) -> None:
+        self._multi.pop(key, None)
+        dict.__delitem__(self, key)
+
+    def pop(self, key: str, *default) -> Any:
+        self._multi.pop(key, None)
+        return dict.pop(self, key, *default)
+
+    def clear(self) -> None:
+        self._multi.clear()
+        dict.clear(self)
+
+    def popitem(self) -> Tuple[str, Any]:
+        key, value = dict.popitem(self)
+        self._multi.pop(key, None)
+        return key, value
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        if key in self:
+            return dict.__getitem__(self, key)
+        dict.__setitem__(self, key, default)
+        return default
+
+    def update(self, *args, **kwargs) -> None:
+        """Replace values like ``md[key] = value``; use add() to append."""
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other) -> "MultiDict":
+        self.update(other)
+        return self
+
+    def copy(self) -> "MultiDict":
+        new = MultiDict(self)
+        new._multi = {key: list(values) for key, values in self._multi.items()}
+        return new
 
     # __repr__ from dict is fine; the custom one added no value
 
+class Headers(Mapping):
+    """Read-only, case-insensitive view over the raw ASGI header list.
+
+    Nothing is decoded up front: lookups scan the (bytes, bytes) pairs and
+    decode only the value asked for. Repeated headers are joined with
+    ``", "`` (``"; "`` for cookie), getlist() returns them separately.
+    Iterating or taking len() builds a name index once.
+    """
+
+    __slots__ = ("raw", "_index")
+
+    def __init__(self, raw: List[Tuple[bytes, bytes]]):
+        self.raw = raw
+        self._index: Optional[Dict[str, List[bytes]]] = None
+
+    def _values(self, key: str) -> List[bytes]:
+        # ASGI servers send header names lowercased
+        name = key.lower().encode("latin-1")
+        return [value for raw_name, value in self.raw if raw_name == name]
+
+    def __getitem__(self, key: str) -> str:
+        name = key.lower().encode("latin-1")
+        found = None
+        for raw_name, value in self.raw:
+            if raw_name == name:
+                if found is None:
+                    found = value
+                else:
+                    # Rare: repeated header, fall back to collecting all of them
+                    return self._join(key, self._values(key))
+        if found is None:
+            raise KeyError(key)
+        return found.decode("latin-1")
+
+    @staticmethod
+    def _join(key: str, values: List[bytes]) -> str:
+        separator = "; " if key.lower() == "cookie" else ", "
+        return separator.join(value.decode("latin-1") for value in values)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def getlist(self, key: str) -> List[str]:
+        return [value.decode("latin-1") for value in self._values(key)]
+
+    def __contains__(self, key: object) -> bool:
+        if not isinstance(key, str):
+            return False
+        name = key.lower().encode("latin-1")
+        for raw_name, _ in self.raw:
+            if raw_name == name:
+                return True
+        return False
+
+    def _build_index(self) -> Dict[str, List[bytes]]:
+        if self._index is None:
+            index: Dict[str, List[bytes]] = {}
+            for raw_name, value in self.raw:
+                index.setdefault(raw_name.decode("latin-1").lower(), []).append(value)
+            self._index = index
+        return self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._build_index())
+
+    def __len__(self) -> int:
+        return len(self._build_index())
+
+    def __repr__(self) -> str:
+        return f"Headers({self.raw!r})"
+
 class Request:
     """Wraps an ASGI scope/receive/send triple.
 
@@ -56,10 +224,13 @@ class Request:
         "_query_params",
         "_headers",
         "_cookies",
+        "_session",
+        "_user",
 
-        # Set externally by Nebula after session/auth resolution
-        "session",
-        "user",
+        # Set externally by Nebula after routing
+        "path_params",
+        "max_body_size",  # bytes stream() may read, None for no limit
+        "_app",  # the Nebula app that opens the session and loads the user
         "state", # New: A dictionary to hold arbitrary request-specific data
     )
 
@@ -88,10 +259,24 @@ class Request:
         self._headers = None
         self._cookies = None
 
-        self.session = None
-        self.user = None
+        self.path_params: Dict[str, Any] = {}
+        self.max_body_size: Optional[int] = None
+        self._session = None
+        self._user = None
+        self._app = None
         self.state: Dict[str, Any] = {} # Initialize state as an empty dictionary
 
+    def _rebind(self, scope: dict) -> None:
+        """Follow a scope that a middleware replaced or whose path it rewrote."""
+        if scope is not self.scope:
+            self.scope = scope
+            self._query_string = None
+            self._query_params = None
+            self._headers = None
+            self._cookies = None
+        self.path = scope["path"]
+        self._url = None
+
     @property
     def url(self) -> str:
         if self._url is not None:
@@ -125,28 +310,92 @@ class Request:
     def query_params(self) -> MultiDict:
         if self._query_params is None:
             qs = self.query_string
-            self._query_params = _parse_pairs(qs) if qs else MultiDict()
+            if not qs:
+                self._query_params = MultiDict()
+            else:
+                semicolon = self._app is not None and self._app.query_semicolon
+                self._query_params = parse_query_string(qs, semicolon=semicolon)
         return self._query_params
 
     @property
-    def headers(self) -> Dict[str, str]:
+    def headers(self) -> Headers:
         if self._headers is None:
-            # ASGI delivers headers as a list of (bytes, bytes) tuples.
-            # Decode all at once; lower() is the HTTP/2 canonical form.
-            self._headers = {
-                name.decode("latin-1").lower(): value.decode("latin-1")
-                for name, value in self.scope["headers"]
-            }
+            # Wraps the scope list as-is, values are decoded on lookup
+            self._headers = Headers(self.scope["headers"])
         return self._headers
 
+    @property
+    def session(self):
+        """The session, opened from the cookie on first access.
+
+        None when sessions are not enabled.
+        """
+        if self._session is None and self._app is not None:
+            manager = self._app._session_manager
+            if manager is not None:
+                self._session = manager.open_session(self)
+        return self._session
+
+    @session.setter
+    def session(self, value) -> None:
+        self._session = value
+
+    async def get_session(self):
+        """The session, like ``request.session``.
+
+        Server-side sessions in a store doing I/O (SQLite, Redis) are fetched
+        in the thread pool instead of on first access on the event loop.
+        """
+        if self._app is None or self._app._session_manager is None:
+            return self.session
+        return await self._app._open_session(self)
+
+    @property
+    def user(self):
+        """The logged-in user, None without sessions.
+
+        Loaded on first access. Running the ``user_loader`` needs a worker
+        thread (sync handlers); on the event loop, ``await get_user()`` first
+        unless the user is anonymous or already cached.
+        """
+        if self._user is None and self._app is not None and self._app._session_manager is not None:
+            self._user = self._app._load_user_sync(self)
+        return self._user
+
+    @user.setter
+    def user(self, value) -> None:
+        self._user = value
+
+    async def get_user(self):
+        """Load the user, awaiting async loaders; later ``request.user`` reads reuse it."""
+        if self._user is None and self._app is not None and self._app._session_manager is not None:
+            self._user = await self._app._load_user(self)
+        return self._user
+
     async def stream(self) -> AsyncGenerator[bytes, None]:
-        """Yield raw body chunks as they arrive."""
+        """Yield raw body chunks as they arrive.
+
+        Raises PayloadTooLarge as soon as more than ``max_body_size`` bytes
+        have been received, without reading the rest.
+        """
+        if self._body is not None:
+            # Already read (e.g. by SyncJSONMiddleware), replay it
+            if self._body:
+                yield self._body
+            return
+
+        limit = self.max_body_size
+        received = 0
+
         while True:
             message = await self._receive()
             msg_type = message["type"]
             if msg_type == "http.request":
                 body = message.get("body", b"")
                 if body:
+                    received += len(body)
+                    if limit is not None and received > limit:
+                        raise PayloadTooLarge()
                     yield body
                 if not message.get("more_body", False):
                     break
@@ -190,12 +439,42 @@ class Request:
             "Request body not loaded. Use 'await request.json()' or preload it via middleware."
         )
 
-    async def form(self) -> MultiDict:
+    def multipart(self, **limits) -> AsyncIterator[Tuple[str, Union[str, UploadFile]]]:
+        """Iterate a multipart/form-data body part by part, without buffering it.
+
+        ``limits`` are passed to MultiPartParser (spool_size, max_field_size,
+        max_file_size, max_total_size, max_parts).
+        """
+        return MultiPartParser(self.headers.get("content-type", ""), self.stream(), **limits).parse()
+
+    async def form(self, **limits) -> MultiDict:
         if self._form is None:
-            raw = await self.text()
-            self._form = _parse_pairs(raw) if raw else MultiDict()
+            content_type = self.headers.get("content-type", "")
+
+            if content_type.startswith("multipart/form-data"):
+                form = MultiDict()
+                try:
+                    async for name, value in self.multipart(**limits):
+                        form.add(name, value)
+                except BaseException:
+                    for _, value in form.multi_items():
+                        if isinstance(value, UploadFile):
+                            await value.close()
+                    raise
+                self._form = form
+            else:
+                raw = await self.text()
+                max_pairs = limits.get("max_parts", DEFAULT_MAX_PAIRS)
+                self._form = parse_query_string(raw, max_pairs) if raw else MultiDict()
         return self._form
 
+    async def close(self) -> None:
+        """Close uploaded files of a parsed multipart form."""
+        if self._form is not None:
+            for _, value in self._form.multi_items():
+                if isinstance(value, UploadFile):
+                    await value.close()
+
     @property
     def cookies(self) -> Dict[str, str]:
         if self._cookies is None:
@@ -1,5 +1,32 @@
+import hashlib
 import orjson
-from typing import Dict, Optional
+import os
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from typing import AsyncIterable, Dict, Iterable, List, Optional, Tuple, Union
+
+from .concurrency import ThreadPool, iterate_in_threadpool, run_in_threadpool
+
+def weak_etag(body: bytes) -> str:
+    """Weak ETag for an encoded body: ``W/"<blake2b digest>"``."""
+    return 'W/"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of ``etag`` against an If-None-Match header value."""
+    if not if_none_match:
+        return False
+
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == opaque:
+            return True
+    return False
+
+
+# Headers describing the omitted body, dropped from 304 responses
+_BODY_HEADERS = frozenset((b"content-length", b"content-type", b"content-encoding", b"transfer-encoding"))
 
 class Response:
     """ASGI HTTP response.
@@ -41,6 +68,31 @@ class Response:
 
         self._encoded_headers = raw
 
+    @classmethod
+    def from_encoded(cls, body: bytes, status_code: int, encoded_headers: list) -> "Response":
+        """Build a response from already-encoded parts, skipping all header work.
+
+        The header list is copied so add_header() on one response never leaks
+        into another built from the same cached parts.
+        """
+        response = cls.__new__(cls)
+        response.status_code = status_code
+        response.body = body
+        response._encoded_headers = list(encoded_headers)
+        return response
+
+    def to_not_modified(self) -> "Response":
+        """Bodiless 304 carrying this response's validator and caching headers."""
+        return Response.from_encoded(
+            b"", 304, [(k, v) for k, v in self._encoded_headers if k not in _BODY_HEADERS]
+        )
+
+    def get_header(self, name: bytes) -> Optional[bytes]:
+        for key, value in self._encoded_headers:
+            if key == name:
+                return value
+        return None
+
     # Convenience accessor used by session manager and RedirectResponse
     # to append a header after construction (e.g. Set-Cookie, Location).
     def add_header(self, name: str, value: str) -> None:
@@ -84,4 +136,317 @@ class RedirectResponse(Response):
     def __init__(self, url: str, status_code: int = 302, headers=None):
         h = dict(headers) if headers else {}
         h["location"] = url
-        super().__init__(b"", status_code, h)
\ No newline at end of file
+        super().__init__(b"", status_code, h)
+
+class StreamingResponse(Response):
+    """Send the body chunk by chunk from a sync or async iterator.
+
+    No Content-Length is sent, so the server falls back to chunked transfer
+    encoding. Each chunk is awaited through ``send`` before the next one is
+    pulled, which gives natural backpressure. Sync iterators are advanced in
+    a worker thread so a slow generator cannot block the event loop.
+    """
+
+    __slots__ = ("body_iterator", "thread_pool")
+
+    def __init__(
+        self,
+        content: Union[Iterable[bytes | str], AsyncIterable[bytes | str]],
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+        media_type: Optional[str] = None,
+        thread_pool: Optional[ThreadPool] = None,
+    ):
+        self.status_code = status_code
+        self.body = b""
+        self.body_iterator = content
+        self.thread_pool = thread_pool
+
+        raw: list[tuple[bytes, bytes]] = []
+
+        if headers:
+            for k, v in headers.items():
+                raw.append((k.lower().encode("latin-1"), v.encode("latin-1")))
+
+        raw.append((b"content-type", (media_type or "application/octet-stream").encode("latin-1")))
+
+        self._encoded_headers = raw
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self._encoded_headers,
+        })
+
+        iterator = self.body_iterator
+        if hasattr(iterator, "__aiter__"):
+            chunks = iterator
+        else:
+            chunks = iterate_in_threadpool(iter(iterator), self.thread_pool)
+
+        try:
+            async for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                if not chunk:
+                    continue
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": True,
+                })
+        finally:
+            # Run generator cleanup even when the client went away mid-stream
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+            elif hasattr(iterator, "close"):
+                iterator.close()
+
+        await send({
+            "type": "http.response.body",
+            "body": b"",
+            "more_body": False,
+        })
+
+
+class FileResponse(Response):
+    """Serve a file from disk without loading it into memory.
+
+    The file is read in chunks in a worker thread, or handed to the server
+    through the ``http.response.zerocopysend`` extension when available.
+    Responses carry a strong ETag and Last-Modified, answer
+    If-None-Match / If-Modified-Since with 304 and honour single and
+    multiple byte ranges (206, ``multipart/byteranges``).
+    """
+
+    __slots__ = ("path", "media_type", "stat_result", "chunk_size", "thread_pool")
+
+    MAX_RANGES = 16
+
+    def __init__(
+        self,
+        path: Union[str, "os.PathLike[str]"],
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+        media_type: Optional[str] = None,
+        stat_result: Optional[os.stat_result] = None,
+        chunk_size: int = 64 * 1024,
+        thread_pool: Optional[ThreadPool] = None,
+    ):
+        self.status_code = status_code
+        self.body = b""
+        self.path = path
+        self.media_type = media_type or "application/octet-stream"
+        self.stat_result = stat_result
+        self.chunk_size = chunk_size
+        self.thread_pool = thread_pool
+
+        raw: list[tuple[bytes, bytes]] = []
+
+        if headers:
+            for k, v in headers.items():
+                raw.append((k.lower().encode("latin-1"), v.encode("latin-1")))
+
+        raw.append((b"accept-ranges", b"bytes"))
+
+        self._encoded_headers = raw
+
+    async def _run(self, func, *args):
+        if self.thread_pool is not None:
+            return await self.thread_pool.run(func, *args)
+        return await run_in_threadpool(func, *args)
+
+    @staticmethod
+    def make_etag(st: os.stat_result) -> str:
+        return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+    @staticmethod
+    def _request_headers(scope) -> Dict[bytes, bytes]:
+        wanted = (b"if-none-match", b"if-modified-since", b"range", b"if-range")
+        return {k: v for k, v in scope.get("headers", ()) if k in wanted}
+
+    @staticmethod
+    def not_modified(
+        if_none_match: Optional[str], if_modified_since: Optional[str], etag: str, mtime: float
+    ) -> bool:
+        """True when the request's validators say the client copy is current."""
+        if if_none_match is not None:
+            return etag_matches(if_none_match, etag)
+
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(mtime) <= since
+
+        return False
+
+    @classmethod
+    def _parse_ranges(cls, header: bytes, size: int) -> Optional[List[Tuple[int, int]]]:
+        """Parse a Range header into inclusive (start, end) pairs.
+
+        Returns None when the header should be ignored (full 200 response),
+        an empty list when no range is satisfiable (416).
+        """
+        try:
+            unit, _, spec = header.decode("latin-1").partition("=")
+        except UnicodeDecodeError:
+            return None
+        if unit.strip().lower() != "bytes":
+            return None
+
+        ranges: List[Tuple[int, int]] = []
+        for part in spec.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            start_s, sep, end_s = part.partition("-")
+            if not sep:
+                return None
+            try:
+                if start_s == "":
+                    # Suffix range: the last N bytes
+                    length = int(end_s)
+                    if length <= 0:
+                        continue
+                    start, end = max(size - length, 0), size - 1
+                else:
+                    start = int(start_s)
+                    end = int(end_s) if end_s else size - 1
+            except ValueError:
+                return None
+            if start >= size:
+                continue
+            if start < 0 or end < start:
+                return None
+            ranges.append((start, min(end, size - 1)))
+
+        if len(ranges) > cls.MAX_RANGES:
+            return None
+
+        return ranges
+
+    async def __call__(self, scope, receive, send) -> None:
+        st = self.stat_result
+        if st is None:
+            st = self.stat_result = await self._run(os.stat, self.path)
+
+        size = st.st_size
+        etag = self.make_etag(st)
+        last_modified = formatdate(st.st_mtime, usegmt=True)
+
+        headers = self._encoded_headers
+        headers.append((b"etag", etag.encode("latin-1")))
+        headers.append((b"last-modified", last_modified.encode("latin-1")))
+
+        req = self._request_headers(scope)
+        send_body = scope.get("method") != "HEAD"
+
+        if_none_match = req.get(b"if-none-match")
+        if_modified_since = req.get(b"if-modified-since")
+        if self.status_code == 200 and self.not_modified(
+            if_none_match.decode("latin-1") if if_none_match is not None else None,
+            if_modified_since.decode("latin-1") if if_modified_since is not None else None,
+            etag,
+            st.st_mtime,
+        ):
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        content_type = self.media_type.encode("latin-1")
+
+        ranges = None
+        range_header = req.get(b"range")
+        if range_header is not None and self.status_code == 200:
+            if_range = req.get(b"if-range")
+            # A stale If-Range means the client wants the whole new file
+            if if_range is None or if_range.decode("latin-1") in (etag, last_modified):
+                ranges = self._parse_ranges(range_header, size)
+
+        if ranges is not None and not ranges:
+            headers.append((b"content-range", f"bytes */{size}".encode("latin-1")))
+            headers.append((b"content-length", b"0"))
+            await send({"type": "http.response.start", "status": 416, "headers": headers})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if not ranges:
+            headers.append((b"content-type", content_type))
+            headers.append((b"content-length", str(size).encode("latin-1")))
+            await send({"type": "http.response.start", "status": self.status_code, "headers": headers})
+            if send_body:
+                await self._send_file(scope, send, [(0, size - 1)] if size else [], [b""], b"")
+            else:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            headers.append((b"content-type", content_type))
+            headers.append((b"content-range", f"bytes {start}-{end}/{size}".encode("latin-1")))
+            headers.append((b"content-length", str(end - start + 1).encode("latin-1")))
+            await send({"type": "http.response.start", "status": 206, "headers": headers})
+            if send_body:
+                await self._send_file(scope, send, ranges, [b""], b"")
+            else:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        boundary = secrets.token_hex(16)
+        part_headers = [
+            (
+                f"--{boundary}\r\nContent-Type: {self.media_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+            ).encode("latin-1")
+            for start, end in ranges
+        ]
+        # Every part after the first is preceded by the CRLF closing the previous one
+        part_headers = [part_headers[0]] + [b"\r\n" + p for p in part_headers[1:]]
+        trailer = f"\r\n--{boundary}--\r\n".encode("latin-1")
+        length = sum(len(p) for p in part_headers) + len(trailer) + sum(e - s + 1 for s, e in ranges)
+
+        headers.append((b"content-type", f"multipart/byteranges; boundary={boundary}".encode("latin-1")))
+        headers.append((b"content-length", str(length).encode("latin-1")))
+        await send({"type": "http.response.start", "status": 206, "headers": headers})
+        if send_body:
+            await self._send_file(scope, send, ranges, part_headers, trailer)
+        else:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _send_file(
+        self, scope, send, ranges: List[Tuple[int, int]], prefixes: List[bytes], trailer: bytes
+    ) -> None:
+        """Send each (start, end) range preceded by its prefix, then the trailer."""
+        zerocopy = "http.response.zerocopysend" in scope.get("extensions", {})
+        f = await self._run(open, self.path, "rb")
+
+        try:
+            for (start, end), prefix in zip(ranges, prefixes):
+                if prefix:
+                    await send({"type": "http.response.body", "body": prefix, "more_body": True})
+
+                if zerocopy:
+                    await send({
+                        "type": "http.response.zerocopysend",
+                        "file": f,
+                        "offset": start,
+                        "count": end - start + 1,
+                        "more_body": True,
+                    })
+                    continue
+
+                await self._run(f.seek, start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await self._run(f.read, min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        finally:
+            await self._run(f.close)
+
+        await send({"type": "http.response.body", "body": trailer, "more_body": False})
@@ -1,11 +1,17 @@
+from collections import OrderedDict
 from typing import Callable, Dict, Any, List, Optional, Tuple
 from .middleware import Middleware
 
+def _path_converter(value: str) -> str:
+    return value
+
+
 PATH_CONVERTERS = {
     "int": int,
     "float": float,
     "str": str,
-    "path": lambda x: x,
+    # As the last segment, {name:path} captures the rest of the path, slashes included
+    "path": _path_converter,
 }
 
 
@@ -21,6 +27,10 @@ class Route:
         "_is_static",
         "accepts_request_arg",
         "middlewares",
+        "compiled_app",  # full middleware stack + endpoint, built once
+        "threaded",  # run a sync handler in the app's thread pool
+        "etag",  # None (app default), bool, or callable(request) -> precomputed ETag
+        "max_body_size",  # None (app default) or request body limit in bytes
     )
 
     def __init__(
@@ -38,6 +48,10 @@ class Route:
         self.is_async = is_async
         self.accepts_request_arg = False
         self.middlewares: List["Middleware"] = []
+        self.compiled_app: Optional[Callable] = None
+        self.threaded = True
+        self.etag = None
+        self.max_body_size = None
 
         self.compiled_pattern, self.pattern_parts = self._compile_path(path)
         self._is_static = all(item is None for item in self.compiled_pattern)
@@ -86,8 +100,13 @@ class Route:
             return None
 
         path_parts = path.strip("/").split("/")
+        pattern_len = len(self.pattern_parts)
 
-        if len(path_parts) != len(self.pattern_parts):
+        if self._has_catch_all():
+            if len(path_parts) < pattern_len:
+                return None
+            path_parts[pattern_len - 1:] = ["/".join(path_parts[pattern_len - 1:])]
+        elif len(path_parts) != pattern_len:
             return None
 
         path_params: Dict[str, Any] = {}
@@ -108,6 +127,251 @@ class Route:
 
         return path_params if path_params else None
 
+    def index_key(self) -> tuple:
+        """Identity for duplicate detection: method plus segments, parameter names dropped.
+
+        ``/users/{id}`` and ``/users/{user_id}/`` would match the same
+        requests, so they share a key. Routes without parameters match their
+        exact path only, so ``/about`` and ``/about/`` are distinct.
+        """
+        if self._is_static:
+            return (self.method, self.path_template)
+        return (self.method,) + tuple(
+            part if item is None else item[1]
+            for item, part in zip(self.compiled_pattern, self.pattern_parts)
+        )
+
+    def _has_catch_all(self) -> bool:
+        last = self.compiled_pattern[-1]
+        return last is not None and last[1] is _path_converter
+
+
+class _RouterNode:
+    """One path segment in the router tree."""
+
+    __slots__ = ("static", "params", "catch_alls", "routes")
+
+    def __init__(self) -> None:
+        # literal segment -> child node, an O(1) dict hit per segment
+        self.static: Dict[str, "_RouterNode"] = {}
+        # [(param_name, converter, child)] tried in registration order
+        self.params: List[Tuple[str, Callable, "_RouterNode"]] = []
+        # [(param_name, child)] for a trailing {name:path}, tried last
+        self.catch_alls: List[Tuple[str, "_RouterNode"]] = []
+        # method -> Route for routes that end at this node
+        self.routes: Dict[str, Route] = {}
+
+
+class Router:
+    """Segment-level radix tree over registered routes.
+
+    Every route is inserted once, one node per path segment. Resolving a
+    request walks the tree segment by segment, so the cost depends on the
+    depth of the path rather than on the number of registered routes.
+
+    Literal segments take precedence over parameters, and parameters over a
+    trailing ``{name:path}`` catch-all; when a converter rejects a segment
+    (e.g. ``{id:int}`` given ``"abc"``) the walk backtracks to the next
+    candidate. Routes without parameters live in a plain dict next to the
+    tree and only match their exact path (``/about`` does not answer
+    ``/about/`` or ``//about``); extra slashes around a dynamic path are
+    ignored.
+    """
+
+    __slots__ = ("_root", "_static", "frozen")
+
+    def __init__(self, routes: Optional[List[Route]] = None) -> None:
+        self._root = _RouterNode()
+        # path template -> method -> Route, for routes without parameters
+        self._static: Dict[str, Dict[str, Route]] = {}
+        self.frozen = False
+
+        for route in routes or ():
+            self.add(route)
+
+    def freeze(self) -> None:
+        """Refuse further add() calls and turn candidate lists into tuples."""
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            node.params = tuple(node.params)
+            node.catch_alls = tuple(node.catch_alls)
+            stack.extend(node.static.values())
+            stack.extend(child for _, _, child in node.params)
+            stack.extend(child for _, child in node.catch_alls)
+        self.frozen = True
+
+    def add(self, route: Route) -> None:
+        if self.frozen:
+            raise RuntimeError(f"Router is frozen, cannot add route '{route.path_template}'.")
+
+        if route._is_static:
+            # First registration wins, same as the old linear scan
+            self._static.setdefault(route.path_template, {}).setdefault(route.method, route)
+            return
+
+        node = self._root
+        last = len(route.pattern_parts) - 1
+
+        for index, (compiled_item, part) in enumerate(zip(route.compiled_pattern, route.pattern_parts)):
+            if index == last and route._has_catch_all():
+                for name, existing in node.catch_alls:
+                    if name == compiled_item[0]:
+                        child = existing
+                        break
+                else:
+                    child = _RouterNode()
+                    node.catch_alls.append((compiled_item[0], child))
+            elif compiled_item is None:
+                child = node.static.get(part)
+                if child is None:
+                    child = node.static[part] = _RouterNode()
+            else:
+                param_name, converter = compiled_item
+                for name, conv, existing in node.params:
+                    if name == param_name and conv is converter:
+                        child = existing
+                        break
+                else:
+                    child = _RouterNode()
+                    node.params.append((param_name, converter, child))
+            node = child
+
+        # First registration wins, same as the old linear scan
+        node.routes.setdefault(route.method, route)
+
+    def resolve(self, path: str, method: str) -> Tuple[Optional[Route], Dict[str, Any], set]:
+        """Find the route for ``path`` + ``method`` in a single tree walk.
+
+        Returns (route, path_params, allowed_methods). When no route matches,
+        ``allowed_methods`` holds every method registered for a pattern that
+        matched the path: non-empty means 405, empty means 404.
+        """
+        static = self._static.get(path)
+        if static is not None:
+            route = static.get(method)
+            if route is not None:
+                return route, {}, set()
+            allowed = set(static)
+        else:
+            allowed = set()
+
+        parts = path.strip("/").split("/")
+        params: List[Tuple[str, Any]] = []
+
+        route = self._walk(self._root, parts, 0, method, params, allowed)
+
+        if route is None:
+            return None, {}, allowed
+
+        return route, dict(params), allowed
+
+    def _walk(
+        self,
+        node: _RouterNode,
+        parts: List[str],
+        index: int,
+        method: str,
+        params: List[Tuple[str, Any]],
+        allowed: set,
+    ) -> Optional[Route]:
+        if index == len(parts):
+            routes = node.routes
+            if routes:
+                route = routes.get(method)
+                if route is not None:
+                    return route
+                allowed.update(routes)
+            return None
+
+        part = parts[index]
+
+        child = node.static.get(part)
+        if child is not None:
+            route = self._walk(child, parts, index + 1, method, params, allowed)
+            if route is not None:
+                return route
+
+        for param_name, converter, child in node.params:
+            try:
+                value = converter(part)
+            except (ValueError, TypeError):
+                continue
+
+            params.append((param_name, value))
+            route = self._walk(child, parts, index + 1, method, params, allowed)
+            if route is not None:
+                return route
+            params.pop()
+
+        for param_name, child in node.catch_alls:
+            routes = child.routes
+            if routes:
+                route = routes.get(method)
+                if route is not None:
+                    params.append((param_name, "/".join(parts[index:])))
+                    return route
+                allowed.update(routes)
+
+        return None
+
+
+class RouteCache:
+    """Bounded LRU cache of dynamic route resolutions.
+
+    Keys are plain (path, method) tuples, so a hit costs one tuple hash and
+    no string building. Only successful dynamic matches are stored: static
+    routes already resolve in O(1) and 404s would let arbitrary paths fill
+    the cache. Parameter values are kept as a tuple of pairs and each hit
+    gets its own dict, so callers may mutate the returned values (they
+    become ``request.path_params``) without corrupting the cache.
+    """
+
+    __slots__ = ("capacity", "hits", "misses", "_entries")
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Route, Tuple[Tuple[str, Any], ...]]]" = OrderedDict()
+
+    def get(self, path: str, method: str) -> Optional[Tuple[Route, Dict[str, Any]]]:
+        key = (path, method)
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0], dict(entry[1])
+
+    def set(self, path: str, method: str, route: Route, values: Dict[str, Any]) -> None:
+        if self.capacity <= 0:
+            return
+
+        entries = self._entries
+        entries[(path, method)] = (route, tuple(values.items()))
+        entries.move_to_end((path, method))
+
+        if len(entries) > self.capacity:
+            entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "capacity": self.capacity,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
 
 class RouteGroup:
     def __init__(
@@ -129,6 +393,8 @@ class RouteGroup:
         path: str,
         return_class=None,
         route_middlewares: list["Middleware"] | None = None,
+        threaded: bool = True,
+        etag=None,
     ) -> Callable:
         return self.app.route(
             f"{self.prefix}{path}",
@@ -136,6 +402,8 @@ class RouteGroup:
             return_class,
             group_middlewares=self._middlewares,
             route_middlewares=route_middlewares,
+            threaded=threaded,
+            etag=etag,
         )
 
     def post(
@@ -143,6 +411,8 @@ class RouteGroup:
         path: str,
         return_class=None,
         route_middlewares: list["Middleware"] | None = None,
+        threaded: bool = True,
+        max_body_size: int | None = None,
     ) -> Callable:
         return self.app.route(
             f"{self.prefix}{path}",
@@ -150,6 +420,8 @@ class RouteGroup:
             return_class,
             group_middlewares=self._middlewares,
             route_middlewares=route_middlewares,
+            threaded=threaded,
+            max_body_size=max_body_size,
         )
 
     def put(
@@ -157,6 +429,8 @@ class RouteGroup:
         path: str,
         return_class=None,
         route_middlewares: list["Middleware"] | None = None,
+        threaded: bool = True,
+        max_body_size: int | None = None,
     ) -> Callable:
         return self.app.route(
             f"{self.prefix}{path}",
@@ -164,6 +438,8 @@ class RouteGroup:
             return_class,
             group_middlewares=self._middlewares,
             route_middlewares=route_middlewares,
+            threaded=threaded,
+            max_body_size=max_body_size,
         )
 
     def delete(
@@ -171,6 +447,7 @@ class RouteGroup:
         path: str,
         return_class=None,
         route_middlewares: list["Middleware"] | None = None,
+        threaded: bool = True,
     ) -> Callable:
         return self.app.route(
             f"{self.prefix}{path}",
@@ -178,6 +455,25 @@ class RouteGroup:
             return_class,
             group_middlewares=self._middlewares,
             route_middlewares=route_middlewares,
+            threaded=threaded,
+        )
+
+    def patch(
+        self,
+        path: str,
+        return_class=None,
+        route_middlewares: list["Middleware"] | None = None,
+        threaded: bool = True,
+        max_body_size: int | None = None,
+    ) -> Callable:
+        return self.app.route(
+            f"{self.prefix}{path}",
+            ["PATCH"],
+            return_class,
+            group_middlewares=self._middlewares,
+            route_middlewares=route_middlewares,
+            threaded=threaded,
+            max_body_size=max_body_size,
         )
 
     def route(
@@ -186,6 +482,9 @@ class RouteGroup:
         methods: List[str] = None,
         return_class=None,
         route_middlewares: list["Middleware"] | None = None,
+        threaded: bool = True,
+        etag=None,
+        max_body_size: int | None = None,
     ) -> Callable:
         return self.app.route(
             f"{self.prefix}{path}",
@@ -193,4 +492,7 @@ class RouteGroup:
             return_class,
             group_middlewares=self._middlewares,
             route_middlewares=route_middlewares,
+            threaded=threaded,
+            etag=etag,
+            max_body_size=max_body_size,
         )
@@ -3,32 +3,35 @@ from __future__ import annotations
 import uvicorn
 from typing import Any
 from pathlib import Path
+import asyncio
 import inspect
 
 import socketio
 
-from .middleware import Middleware, BaseMiddleware
+from .concurrency import SingleFlight, ThreadPool
+from .middleware import Middleware, BaseMiddleware, CORSMiddleware
 from .request import Request
-from .response import Response, PlainTextResponse, HTMLResponse, JSONResponse, RedirectResponse
-from .routing import Route, RouteGroup
-from .session import SecureCookieSessionManager, AnonymousUser
+from .response import Response, PlainTextResponse, HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse, FileResponse, etag_matches, weak_etag
+from .routing import Route, RouteGroup, Router, RouteCache
+from .cache import Cache, CacheBackend, MemoryBackend, MISSING
+from .session import SecureCookieSessionManager, ServerSideSessionManager, AnonymousUser
 from .utils.render_template import ( 
     render_template, render_template_async, render_template_string, render_template_string_async 
 )
 
 from .utils import init_template_path, init_template_renderer, init_static_serving, init_template_renderer_sync
-from .cache import cached
-
 from .types import (
+    ASGIApp,
     AVAILABLE_METHODS,
     DEFAULT_TEMPLATES_DIR,
     DEFAULT_STATICS_DIR,
     DEFAULT_404_BODY,
     DEFAULT_500_BODY,
     DEFAULT_405_BODY,
+    DEFAULT_413_BODY,
 )
 
-from .exceptions import InvalidMethod, DuplicateEndpoint, InvalidHTTPErrorCode, InvalidResponseClass, HTTPException, ExtraArgumentsDetected
+from .exceptions import InvalidMethod, DuplicateEndpoint, InvalidHTTPErrorCode, InvalidResponseClass, HTTPException, ExtraArgumentsDetected, PayloadTooLarge
 from contextvars import ContextVar
 
 from contextlib import contextmanager # Added import
@@ -97,6 +100,10 @@ def is_valid_response_class(obj):
         return False
 
 def auto_detect_response(content):
+    # Generators are streamed instead of buffered
+    if inspect.isgenerator(content) or inspect.isasyncgen(content):
+        return StreamingResponse(content, media_type="text/plain")
+
     # JSON (strong signal)
     if isinstance(content, (dict, list)):
         return JSONResponse(content)
@@ -124,7 +131,10 @@ class Nebula:
         port: int | str = 5000, debug: bool = False,
         import_string: str | None = None, module_name: str | None = None,
         middlewares: list[Middleware] = None, make_current: bool = True, sync_request_support: bool = False,
-        init_all: bool = False, static_dir: str | None = None, template_dir: str | None = None
+        init_all: bool = False, static_dir: str | None = None, template_dir: str | None = None,
+        route_cache_size: int = 1024, sync_workers: int | None = None, etag: bool = False,
+        max_body_size: int | None = None, freeze_routes: bool = False,
+        query_semicolon: bool = False
     ):
         if make_current:
             self.make_current()
@@ -142,6 +152,27 @@ class Nebula:
         self._static_routes: dict[tuple, Route] = {}
         self._dynamic_routes: list[Route] = []
         self._path_methods: dict[str, set] = {}
+        self._route_keys: set[tuple] = set()  # Route.index_key() of every route, for duplicates
+        self._router = Router()
+        self.route_cache = RouteCache(route_cache_size)
+        self._dispatch_app: ASGIApp | None = None  # global middlewares around handle_http
+
+        # Sync handlers, user loaders and error handlers run here, never on the loop
+        self.thread_pool = ThreadPool(sync_workers)
+
+        self.static_files = None  # StaticFiles set by init_static_serving
+
+        # Hash GET response bodies into weak ETags unless a route says otherwise
+        self.etag = etag
+
+        # Request body limit in bytes, routes can override it
+        self.max_body_size = max_body_size
+
+        # Also split query strings on ';' (request.query_params)
+        self.query_semicolon = query_semicolon
+
+        # Freeze the route table on the first request, see freeze()
+        self._freeze_pending = freeze_routes
 
         self.templates_dir = DEFAULT_TEMPLATES_DIR or template_dir
         self.statics_dir = DEFAULT_STATICS_DIR or static_dir
@@ -149,6 +180,7 @@ class Nebula:
         self.NOT_FOUND = DEFAULT_404_BODY
         self.INTERNAL_ERROR = DEFAULT_500_BODY
         self.METHOD_NOT_ALLOWED = DEFAULT_405_BODY
+        self.PAYLOAD_TOO_LARGE = DEFAULT_413_BODY
 
 
         # Default error handlers, async flag cached at registration time so
@@ -156,25 +188,29 @@ class Nebula:
         self.error_handlers: dict[int, callable] = {
             404: self.content_not_found_handler,
             405: self.method_not_allowed_handler,
+            413: self.payload_too_large_handler,
             500: self.internal_error_handler,
         }
         self._error_handler_is_async: dict[int, bool] = {
             404: True,
             405: True,
+            413: True,
             500: True,
         }
 
         self._error_handler_params: dict[int, set] = {
             404: {"self", "code"},
             405: {"self", "code"},
+            413: {"self", "code"},
             500: {"self", "code"},
         }
 
         self.jinja_env = None
         self.jinja_env_sync = None
 
-        if sync_request_support:
-            self._middlewares.append(Middleware(SyncJSONMiddleware))
+        # Needs the route's body limit, so it runs after lookup, in front
+        # of the group and route middlewares
+        self._route_prelude: list[Middleware] = [Middleware(SyncJSONMiddleware)] if sync_request_support else []
 
         self.sio = socketio.AsyncServer(cors_allowed_origins="*", async_mode="asgi")
 
@@ -186,6 +222,9 @@ class Nebula:
         self._session_manager: SecureCookieSessionManager | None = None
         self._user_loader: callable | None = None
         self._user_loader_is_async: bool = False
+        self._user_cache: Cache | None = None
+        self._user_cache_ttl: float | None = None
+        self._user_flight = SingleFlight()
 
         if init_all:
             self.init_all()
@@ -195,47 +234,79 @@ class Nebula:
         """True when the path template contains no URL parameters."""
         return "{" not in path_template
 
-    def _rebuild_route_index(self) -> None:
-        """Rebuild lookup structures after a route is added.
+    def _add_route(self, route: Route) -> None:
+        """Register a route and insert it into every lookup structure.
 
-        Cost is paid once at startup/registration time, not per request.
+        Costs O(path depth), independent of how many routes exist already.
         """
-        self._static_routes.clear()
-        self._dynamic_routes.clear()
-        self._path_methods.clear()
+        if self._router.frozen:
+            raise RuntimeError(f"Routes are frozen, cannot add '{route.path_template}'.")
 
-        for route in self.routes:
-            pt = route.path_template
-            m  = route.method.upper()
+        key = route.index_key()
+        if key in self._route_keys:
+            raise DuplicateEndpoint(f"Route '{route.path_template}' with method '{route.method}' already exists.")
+        self._route_keys.add(key)
 
-            self._path_methods.setdefault(pt, set()).add(m)
+        self.routes.append(route)
 
-            if self._is_static_path(pt):
-                self._static_routes[(pt, m)] = route
-            else:
-                self._dynamic_routes.append(route)
+        pt = route.path_template
+        m = route.method
+
+        self._path_methods.setdefault(pt, set()).add(m)
+
+        if self._is_static_path(pt):
+            self._static_routes[(pt, m)] = route
+        else:
+            self._dynamic_routes.append(route)
+
+        self._router.add(route)
+        # A new route may shadow a cached dynamic resolution
+        self.route_cache.clear()
+
+    def freeze(self) -> None:
+        """Compile every route and lock the route table against changes.
+
+        Runs automatically on the first request with Nebula(freeze_routes=True).
+        """
+        self._freeze_pending = False
+        self.compile_routes()
+        self._router.freeze()
 
     def _build_core(self):
         async def app(scope, receive, send):
             token_app = _current_app.set(self)
 
             if scope["type"] == "http":
-                async def final_app(inner_scope, inner_receive, inner_send):
-                    request = Request(inner_scope, inner_receive, inner_send)
-                    token = _current_request.set(request)
-                    try:
-                        return await self.handle_http(inner_scope, inner_receive, inner_send)
-                    finally:
-                        _current_request.reset(token)
-
-                # Apply middlewares BEFORE request creation
-                current = final_app
-                for mw in reversed(self._middlewares):
-                    current = mw.build(current)
-
+                if self._freeze_pending:
+                    self.freeze()
+
+                # The request exists before any middleware runs, so global
+                # middlewares can use get_request() as well.
+                request = Request(scope, receive, send)
+                # Session and user are resolved on first access, from anywhere
+                # (middlewares and error handlers included)
+                request._app = self
+                token = _current_request.set(request)
+
+                if request.method == "HEAD":
+                    # Outside every middleware, so they all see the GET body
+                    send = _head_send(send)
+                send, started = _track_start(send)
+
+                # Global middlewares run before routing and may rewrite the path
+                app = self._dispatch_app or self._compile_dispatch_app()
                 try:
-                    return await current(scope, receive, send)
+                    return await app(scope, receive, send)
+                except Exception as e:
+                    if started():
+                        # Too late for an error response; the server aborts it
+                        raise
+                    # Raised by a global middleware itself
+                    return await self._handle_exception(e, scope, receive, send)
                 finally:
+                    if request._form is not None:
+                        await request.close()
+                    _current_request.reset(token)
                     _current_app.reset(token_app)
 
             elif scope["type"] == "websocket":
@@ -243,27 +314,308 @@ class Nebula:
 
         return app
 
-    def _build_middlewares(self, app: "ASGIApp") -> "ASGIApp":
-        for mw in reversed(self._middlewares):
+    def _build_middlewares(self, app: ASGIApp, middlewares: list[Middleware] | None = None) -> ASGIApp:
+        for mw in reversed(self._middlewares if middlewares is None else middlewares):
             app = mw.build(app)
 
         return app
 
+    def add_middleware(self, middleware: Middleware) -> None:
+        """Append a global middleware and drop the already compiled chains."""
+        self._middlewares.append(middleware)
+        self._invalidate_compiled_apps()
+
+    def _invalidate_compiled_apps(self) -> None:
+        for route in self.routes:
+            route.compiled_app = None
+        self._dispatch_app = None
+
+    def compile_routes(self) -> None:
+        """Compose every route's middleware stack ahead of the first request.
+
+        Called on lifespan startup; routes registered later are compiled
+        lazily on their first hit.
+        """
+        if self._dispatch_app is None:
+            self._compile_dispatch_app()
+        for route in self.routes:
+            if route.compiled_app is None:
+                self._compile_route(route)
+
+    def _compile_dispatch_app(self) -> ASGIApp:
+        """Build the global middlewares around routing once.
+
+        Error responses (404/405/413/500) are produced inside this stack as
+        well, so they pass through every global middleware.
+        """
+        self._dispatch_app = self._build_middlewares(self.handle_http)
+        return self._dispatch_app
+
+    def _compile_route(self, route: Route) -> ASGIApp:
+        """Build group + route middlewares around the endpoint once."""
+        route.compiled_app = self._build_middlewares(
+            self._make_endpoint(route), self._route_prelude + route.middlewares
+        )
+        return route.compiled_app
+
+    def _make_endpoint(self, route: Route) -> ASGIApp:
+        etag = route.etag if route.etag is not None else self.etag
+        # Validators only make sense for safe methods
+        if route.method not in ("GET", "HEAD"):
+            etag = False
+
+        etag_func = etag if callable(etag) else None
+        etag_func_is_async = etag_func is not None and inspect.iscoroutinefunction(etag_func)
+
+        async def endpoint(scope, receive, send):
+            request = get_request()
+
+            # Middlewares may wrap receive (e.g. SyncJSONMiddleware), read the
+            # body through the channel they hand down.
+            request._receive = receive
+            if request._body is None:
+                request._body = scope.get("_body")
+
+            values = request.path_params
+
+            precomputed_etag = None
+            if etag_func is not None:
+                # Cheap validator from the app; on a match the handler never runs
+                precomputed_etag = await etag_func(request) if etag_func_is_async else etag_func(request)
+
+                if precomputed_etag is not None and etag_matches(request.headers.get("if-none-match"), precomputed_etag):
+                    response = Response.from_encoded(b"", 304, [(b"etag", precomputed_etag.encode("latin-1"))])
+                    return await response(scope, receive, send)
+
+            # The actual route handler execution
+            if route.is_async:
+                if route.accepts_request_arg:
+                    response_content = await route.handler(request, **values)
+                else:
+                    response_content = await route.handler(**values)
+            elif route.threaded:
+                if route.accepts_request_arg:
+                    response_content = await self.thread_pool.run(route.handler, request, **values)
+                else:
+                    response_content = await self.thread_pool.run(route.handler, **values)
+            else:
+                # Opted out of the thread pool, known to be trivially fast
+                if route.accepts_request_arg:
+                    response_content = route.handler(request, **values)
+                else:
+                    response_content = route.handler(**values)
+
+            # Wrap bare return values into Response objects
+            if isinstance(response_content, Response):
+                response = response_content
+            elif route.return_class:
+                response = route.return_class(response_content)
+            else:
+                response = auto_detect_response(response_content)
+
+            # Sync stream bodies and file reads go through the app's bounded pool
+            if isinstance(response, (StreamingResponse, FileResponse)) and response.thread_pool is None:
+                response.thread_pool = self.thread_pool
+
+            if precomputed_etag is not None:
+                if response.get_header(b"etag") is None:
+                    response.add_header("etag", precomputed_etag)
+
+            elif etag is True and response.status_code == 200 and type(response).__call__ is Response.__call__:
+                # Only fully buffered bodies can be hashed
+                tag = response.get_header(b"etag")
+                if tag is None:
+                    tag = weak_etag(response.body).encode("latin-1")
+                    response.add_header("etag", tag.decode("latin-1"))
+
+                if etag_matches(request.headers.get("if-none-match"), tag.decode("latin-1")):
+                    response = response.to_not_modified()
+
+            # Persist session if it was opened and changed
+            session = request._session
+            if session is None and self._session_manager is not None and self._session_manager.due_for_refresh(request):
+                session = request.session
+            if session is not None and (session.modified or session.refresh):
+                manager = self._session_manager
+                if manager.blocking:
+                    # Server-side store doing I/O
+                    await self.thread_pool.run(manager.save_session, session, response)
+                else:
+                    manager.save_session(session, response)
+
+            await response(scope, receive, send)
+
+        return endpoint
+
     def setup_sessions(
         self,
-        secret_key: str,
+        secret_key: str | bytes | list[str | bytes],
         cookie_name: str = "nebula_session",
         max_age: int = 86400,
         secure: bool = False,
+        store: CacheBackend | None = None,
+        sliding: bool = False,
+        refresh_fraction: float = 0.5,
+        accept_legacy: bool = True,
     ) -> None:
-        """Enable HMAC-signed cookie sessions."""
+        """Enable HMAC-signed cookie sessions.
+
+        With a ``store`` (a `nebula.cache` backend) the data stays server-side
+        and the cookie only carries a signed session ID. ``sliding`` renews
+        active sessions once ``refresh_fraction`` of ``max_age`` has passed.
+        ``accept_legacy`` still reads cookies signed in the old hex format and
+        re-issues them; turn it off once ``max_age`` has passed since upgrading.
+        """
+        if store is not None:
+            self._session_manager = ServerSideSessionManager(
+                secret_key=secret_key,
+                store=store,
+                cookie_name=cookie_name,
+                max_age=max_age,
+                secure=secure,
+                sliding=sliding,
+                refresh_fraction=refresh_fraction,
+            )
+            return
+
         self._session_manager = SecureCookieSessionManager(
             secret_key=secret_key,
             cookie_name=cookie_name,
             max_age=max_age,
             secure=secure,
+            sliding=sliding,
+            refresh_fraction=refresh_fraction,
+            accept_legacy=accept_legacy,
         )
 
+    def setup_cors(
+        self,
+        allow_origins: list[str] | tuple = ("*",),
+        allow_methods: list[str] | None = None,
+        allow_headers: list[str] | tuple = (),
+        allow_credentials: bool = False,
+        expose_headers: list[str] | tuple = (),
+        max_age: int = 600,
+    ) -> None:
+        """Enable CORS; preflights are answered from the routes registered for the path."""
+        self._middlewares.insert(0, Middleware(
+            CORSMiddleware,
+            allow_origins=allow_origins,
+            allow_methods=allow_methods,
+            allow_headers=allow_headers,
+            allow_credentials=allow_credentials,
+            expose_headers=expose_headers,
+            max_age=max_age,
+            path_methods=self.allowed_methods,
+        ))
+        self._invalidate_compiled_apps()
+
+    def _load_user_sync(self, request: Request) -> Any:
+        """Resolve ``request.user`` on first access.
+
+        Anonymous requests and cached users need no loader call. The loader
+        itself may block, so it only runs when accessed from a worker thread
+        (sync handlers); async code awaits ``request.get_user()`` instead.
+        """
+        user_loader = self._user_loader
+        if user_loader is None:
+            return AnonymousUser()
+
+        uid = request.session.get(SecureCookieSessionManager._USER_ID_KEY)
+        if uid is None:
+            return AnonymousUser()
+
+        user_cache = self._user_cache
+        if user_cache is not None:
+            loaded = user_cache.backend.get(("nebula:user", uid), MISSING)
+            if loaded is not MISSING:
+                return loaded if loaded is not None else AnonymousUser()
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError(
+                "Loading the user would block the event loop. Use 'await request.get_user()' in async code."
+            )
+
+        if self._user_loader_is_async:
+            loop = self.thread_pool.loop
+            if loop is None:
+                raise RuntimeError("An async user_loader can only be awaited from the event loop thread.")
+            return asyncio.run_coroutine_threadsafe(self._load_user(request), loop).result()
+
+        loaded = user_loader(uid)
+        if user_cache is not None:
+            user_cache.set(("nebula:user", uid), loaded, ttl=self._user_cache_ttl)
+        return loaded if loaded is not None else AnonymousUser()
+
+    async def _load_user(self, request: Request) -> Any:
+        """Resolve ``request.get_user()``; sync loaders run in the thread pool."""
+        user_loader = self._user_loader
+        if user_loader is None:
+            return AnonymousUser()
+
+        session = await self._open_session(request)
+        uid = session.get(SecureCookieSessionManager._USER_ID_KEY)
+        if uid is None:
+            return AnonymousUser()
+
+        if self._user_cache is None:
+            loaded = await self._call_user_loader(uid)
+        else:
+            loaded = await self._load_user_cached(uid)
+
+        return loaded if loaded is not None else AnonymousUser()
+
+    async def _open_session(self, request: Request) -> Any:
+        """``request.session``, with server-side data fetched in the thread
+        pool when the store does I/O."""
+        session = request.session
+        if session is not None and self._session_manager.blocking and not session.loaded:
+            await self.thread_pool.run(session.load)
+        return session
+
+    async def _call_user_loader(self, uid: Any) -> Any:
+        if self._user_loader_is_async:
+            return await self._user_loader(uid)
+        return await self.thread_pool.run(self._user_loader, uid)
+
+    async def _load_user_cached(self, uid: Any) -> Any:
+        key = ("nebula:user", uid)
+        loaded = self._user_cache.backend.get(key, MISSING)
+        if loaded is not MISSING:
+            return loaded
+
+        # Single flight: concurrent requests for one ID share a loader call
+        user_cache, ttl = self._user_cache, self._user_cache_ttl
+        return await self._user_flight.do(
+            key,
+            lambda: self._call_user_loader(uid),
+            lambda value: user_cache.set(key, value, ttl=ttl),
+        )
+
+    def setup_user_cache(self, ttl: float | None = 60, max_size: int = 1024, backend: CacheBackend | None = None) -> None:
+        """Cache ``user_loader`` results by user ID.
+
+        Entries live for ``ttl`` seconds; ``backend`` defaults to a
+        `MemoryBackend` holding ``max_size`` users. Cached user objects are
+        shared between requests, so treat them as read-only.
+        """
+        self._user_cache = Cache(backend if backend is not None else MemoryBackend(max_size=max_size))
+        self._user_cache_ttl = ttl
+        self._user_flight = SingleFlight()
+
+    def invalidate_user(self, uid: Any) -> None:
+        """Forget the cached user for ``uid``, e.g. after it was changed or deleted."""
+        if self._user_cache is None:
+            return
+        key = ("nebula:user", uid)
+        self._user_cache.delete(key)
+        # A loader call still running for this ID must not store its result
+        self._user_flight.forget(key)
+
     def user_loader(self, func: callable) -> callable:
         """Register a callback that loads a user object from a stored ID."""
         self._user_loader = func
@@ -296,162 +648,121 @@ class Nebula:
         while True:
             message = await receive()
             if message["type"] == "lifespan.startup":
+                self.compile_routes()
                 print("\033[1;36m[ STARTUP ]\033[1;0m")
                 await send({"type": "lifespan.startup.complete"})
 
             elif message["type"] == "lifespan.shutdown":
+                self.thread_pool.shutdown(wait=False)
                 print("\033[1;36m[ SHUTDOWN ]\033[1;0m")
                 await send({"type": "lifespan.shutdown.complete"})
                 return
 
-    @cached()
-    def _lookup_route(self, path: str, method: str) -> tuple[Route | None, dict[str, Any], bool]:
+    def _lookup_route(self, path: str, method: str) -> tuple[Route | None, dict[str, Any], set]:
         """
-        Lookup a route based on path and method. Caches the result.
-        Returns (route, values, path_matched_wrong_method).
+        Lookup a route based on path and method.
+        Returns (route, values, allowed_methods), allowed_methods is only
+        non-empty when the path exists but not for this method (405).
         """
-        route = None
-        values: dict[str, Any] = {}
-        path_matched_wrong_method = False
-
         # O(1) static lookup, covers the vast majority of routes
         route = self._static_routes.get((path, method))
 
-        if route is None:
-            # Walk dynamic (parameterised) routes
-            for r in self._dynamic_routes:
-                # Try to match with the correct method first
-                m = r.match(path, method)
-
-                if m is not None:
-                    route = r
-                    values = m
-                    break
+        if route is not None:
+            return route, {}, set()
 
-                # Check if path matches but method is wrong
-                # We need to check if the path pattern matches regardless of method
-                path_parts = path.strip("/").split("/")
-                if len(path_parts) == len(r.pattern_parts):
-                    # Check if all static parts match
-                    path_structure_matches = True
-                    for compiled_item, pattern_part, path_part in zip(
-                        r.compiled_pattern, r.pattern_parts, path_parts
-                    ):
-                        if compiled_item is None and pattern_part != path_part:
-                            path_structure_matches = False
-                            break
-                    
-                    if path_structure_matches:
-                        # Path structure matches, but method is wrong
-                        if r.method != method:
-                            path_matched_wrong_method = True
-                        else:
-                            # Method matches but something else failed - check dynamic params
-                            m = r.match(path, method)
-                            if m is not None:
-                                route = r
-                                values = m
-                                break
-
-        return route, values, path_matched_wrong_method
+        if not self._dynamic_routes:
+            # Nothing else can match: 404 vs 405 is one more dict lookup
+            methods = self._path_methods.get(path)
+            return None, {}, set(methods) if methods else set()
 
-    async def handle_http(self, scope: dict, receive: callable, send: callable):
-        request = get_request()
+        cached = self.route_cache.get(path, method)
+        if cached is not None:
+            return cached[0], cached[1], set()
 
-        session = None
-        session_mgr = self._session_manager
+        # Single tree walk resolves params and the 404-vs-405 decision
+        route, values, allowed_methods = self._router.resolve(path, method)
 
-        if session_mgr is not None:
-            session = session_mgr.open_session(request)
-            request.session = session
+        # Only dynamic hits are cached, misses would let scanners fill it
+        if route is not None:
+            self.route_cache.set(path, method, route, values)
 
-            user_loader = self._user_loader
+        return route, values, allowed_methods
 
-            if user_loader is not None:
-                uid = session.get(SecureCookieSessionManager._USER_ID_KEY)
+    def allowed_methods(self, path: str) -> set:
+        """Every method that has a route for ``path``, HEAD included when GET is.
 
-                if uid is not None:
-                    if self._user_loader_is_async:
-                        loaded = await user_loader(uid)
-                    else:
-                        loaded = user_loader(uid)
+        Apps with only static routes answer from the precomputed
+        _path_methods table, otherwise it costs a single router walk.
+        """
+        if self._dynamic_routes:
+            # The router holds static routes too; an unknown method collects
+            # the methods of every pattern matching the path
+            methods = self._router.resolve(path, "")[2]
+        else:
+            methods = set(self._path_methods.get(path, ()))
 
-                    request.user = loaded if loaded is not None else AnonymousUser()
-                else:
-                    request.user = AnonymousUser()
-            else:
-                request.user = AnonymousUser()
+        if "GET" in methods:
+            methods.add("HEAD")
+        return methods
+
+    async def handle_http(self, scope: dict, receive: callable, send: callable):
+        request = get_request()
+        if scope is not request.scope or scope["path"] != request.path:
+            # A global middleware replaced the scope or rewrote the path
+            request._rebind(scope)
 
-        path = request.path
         method = request.method
+        route, values, allowed_methods = self._lookup_route(request.path, method)
 
-        route, values, path_matched_wrong_method = self._lookup_route(path, method)
+        if method == "HEAD" and route is None:
+            # Served by the GET route unless HEAD is registered explicitly
+            route, values, allowed_methods = self._lookup_route(request.path, "GET")
 
         if route is None:
-            # Determine 404 vs 405 when no dynamic route handled it
-            if not path_matched_wrong_method:
-                # Check static routes for wrong-method 405 detection
-                for (pt, _), r in self._static_routes.items():
-                    if pt == path:
-                        path_matched_wrong_method = True
-                        break
-
-            if path_matched_wrong_method:
-                return await self._dispatch_error(405, scope, receive, send)
-
-            return await self._dispatch_error(404, scope, receive, send)
-        
-        # Middleware application for the route handler
-        async def call_handler(inner_scope, inner_receive, inner_send):
-            # The actual route handler execution
-            if route.is_async:
-                if route.accepts_request_arg:
-                    response_content = await route.handler(request, **values)
-                else:
-                    response_content = await route.handler(**values)
+            if allowed_methods:
+                code = 405
+                if "GET" in allowed_methods:
+                    allowed_methods.add("HEAD")
+                # Read back by _dispatch_error to emit the Allow header
+                scope["nebula.allowed_methods"] = allowed_methods
             else:
-                if route.accepts_request_arg:
-                    response_content = route.handler(request, **values)
-                else:
-                    response_content = route.handler(**values)
+                code = 404
+            return await self._dispatch_error(code, scope, receive, send)
 
-            # Wrap bare return values into Response objects
-            if isinstance(response_content, Response):
-                response = response_content
-            elif route.return_class:
-                if isinstance(response_content, Response):
-                    response = response_content
-                else:
-                    response = route.return_class(response_content)
-            else:
-                response = auto_detect_response(response_content)
+        request.path_params = values
+
+        limit = route.max_body_size if route.max_body_size is not None else self.max_body_size
+        if limit is not None:
+            request.max_body_size = limit
 
-            # Persist session if dirty
-            if session is not None and session.modified:
-                session_mgr.save_session(session, response)
-            
-            await response(inner_scope, inner_receive, inner_send)
+            # Reject on the declared size before reading a single body chunk
+            content_length = request.headers.get("content-length")
+            if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+                return await self._dispatch_error(413, scope, receive, send)
 
-        current_app = call_handler
-        # Apply global middlewares first, then route-specific middlewares
-        # Middlewares are applied in reverse order of how they should execute (outermost first)
-        all_middlewares = self._middlewares + route.middlewares
-        for mw in reversed(all_middlewares):
-            current_app = mw.build(current_app)
+        # Composed once per route, the hot path only calls into it
+        app = route.compiled_app or self._compile_route(route)
+        route_send, started = _track_start(send)
 
         try:
-            return await current_app(scope, receive, send)
+            return await app(scope, receive, route_send)
 
         except Exception as e:
-            error = str(e)
-            print(f"\033[1;31mERROR:\033[1;0m {error if len(error) > 0 else 'No description provided.'}")
+            if started():
+                # A streamed body failed midway, the status line is already out
+                raise
+            return await self._handle_exception(e, scope, receive, send)
 
-            if isinstance(e, HTTPException):
-                status_code = e.status_code
-            else:
-                status_code = 500
+    async def _handle_exception(self, e: Exception, scope, receive, send):
+        error = str(e)
+        print(f"\033[1;31mERROR:\033[1;0m {error if len(error) > 0 else 'No description provided.'}")
+
+        if isinstance(e, HTTPException):
+            status_code = e.status_code
+        else:
+            status_code = 500
 
-            return await self._dispatch_error(status_code, scope, receive, send)
+        return await self._dispatch_error(status_code, scope, receive, send)
 
     async def _dispatch_error(self, code: int, scope, receive, send):
         handler = self.error_handlers.get(code) or self.error_handlers[500]
@@ -480,7 +791,7 @@ class Nebula:
         if self._error_handler_is_async.get(code, True):
             result = await handler(**filtered_kwargs)
         else:
-            result = handler(**filtered_kwargs)
+            result = await self.thread_pool.run(handler, **filtered_kwargs)
 
         if isinstance(result, Response):
             response: Response = result
@@ -489,9 +800,14 @@ class Nebula:
         
         response.status_code = code # Set the correct status code
 
+        if code == 405:
+            allowed_methods = scope.get("nebula.allowed_methods")
+            if allowed_methods and response.get_header(b"allow") is None:
+                response.add_header("allow", ", ".join(sorted(allowed_methods)))
+
         await response(scope, receive, send)
 
-    def route(self, path: str, methods: list[str] = None, return_class = None, group_middlewares: list[Middleware] | None = None, route_middlewares: list[Middleware] | None = None) -> callable:
+    def route(self, path: str, methods: list[str] = None, return_class = None, group_middlewares: list[Middleware] | None = None, route_middlewares: list[Middleware] | None = None, threaded: bool = True, etag = None, max_body_size: int | None = None) -> callable:
         def decorator(f: callable) -> callable:
             mds = methods or ["GET"]
             is_async = inspect.iscoroutinefunction(f)
@@ -499,52 +815,56 @@ class Nebula:
             # Check if the handler accepts request
             accepts_request = handler_accepts_request(f)
 
-            for method in mds:
-                if method not in AVAILABLE_METHODS:
-                    raise InvalidMethod(f"Method: '{method}' not recognized.")
+            sig = inspect.signature(f)
+            annotation = None if sig.return_annotation is inspect._empty else sig.return_annotation 
+            final_return = return_class if return_class is not None else annotation
 
-                for existing_route in self.routes:
-                    if existing_route.path_template == path and existing_route.method == method.upper():
-                        raise DuplicateEndpoint(f"Route '{path}' with method '{method}' already exists.")
+            if not is_valid_response_class(final_return) and final_return is not None:
+                name = getattr(final_return, "__name__", str(final_return))
 
-                sig = inspect.signature(f)
-                annotation = None if sig.return_annotation is inspect._empty else sig.return_annotation 
-                final_return = return_class if return_class is not None else annotation
+                obj_name = "Class" if isinstance(final_return, type) else "Type"
 
-                if not is_valid_response_class(final_return) and final_return is not None:
-                    name = getattr(final_return, "__name__", str(final_return))
-
-                    obj_name = "Class" if isinstance(final_return, type) else "Type"
+                raise InvalidResponseClass(
+                    f"{obj_name}: {name} does not inherit from Response class."
+                )
 
-                    raise InvalidResponseClass(
-                        f"{obj_name}: {name} does not inherit from Response class."
-                    )
+            for method in mds:
+                if method not in AVAILABLE_METHODS:
+                    raise InvalidMethod(f"Method: '{method}' not recognized.")
 
                 new_route = Route(path, method, f, final_return)
                 new_route.is_async = is_async # cache async flag on the Route object
                 new_route.accepts_request_arg = accepts_request
+                new_route.threaded = threaded
+                new_route.etag = etag
+                new_route.max_body_size = max_body_size
 
                 # Assign middlewares
                 new_route.middlewares = (group_middlewares or []) + (route_middlewares or [])
 
-                self.routes.append(new_route)
+                self._add_route(new_route)
 
-            self._rebuild_route_index()
             return f
 
         return decorator
 
-    def get(self, path: str, return_class = None) -> callable:
-        return self.route(path, ["GET"], return_class)
+    def get(self, path: str, return_class = None, threaded: bool = True, etag = None) -> callable:
+        return self.route(path, ["GET"], return_class, threaded=threaded, etag=etag)
     
-    def post(self, path: str, return_class = None) -> callable:
-        return self.route(path, ["POST"], return_class)
+    def post(self, path: str, return_class = None, threaded: bool = True, max_body_size: int | None = None) -> callable:
+        return self.route(path, ["POST"], return_class, threaded=threaded, max_body_size=max_body_size)
+
+    def put(self, path: str, return_class = None, threaded: bool = True, max_body_size: int | None = None) -> callable:
+        return self.route(path, ["PUT"], return_class, threaded=threaded, max_body_size=max_body_size)
+
+    def delete(self, path: str, return_class = None, threaded: bool = True) -> callable:
+        return self.route(path, ["DELETE"], return_class, threaded=threaded)
 
-    def put(self, path: str, return_class = None) -> callable:
-        return self.route(path, ["PUT"], return_class)
+    def patch(self, path: str, return_class = None, threaded: bool = True, max_body_size: int | None = None) -> callable:
+        return self.route(path, ["PATCH"], return_class, threaded=threaded, max_body_size=max_body_size)
 
-    def delete(self, path: str, return_class = None) -> callable:
-        return self.route(path, ["DELETE"], return_class)
+    def options(self, path: str, return_class = None, threaded: bool = True) -> callable:
+        return self.route(path, ["OPTIONS"], return_class, threaded=threaded)
 
     def add_url_rule(
         self, rule: str, endpoint: str = None, view_func: callable = None, return_class = None, **options
@@ -558,10 +878,6 @@ class Nebula:
                 if method not in AVAILABLE_METHODS:
                     raise InvalidMethod(f"Method: '{method}' not recognized.")
 
-                for existing_route in self.routes:
-                    if existing_route.path_template == rule and existing_route.method == method.upper():
-                        raise DuplicateEndpoint(f"Route '{rule}' with method '{method}' already exists.")
-
                 if return_class is not None and not is_valid_response_class(return_class):
                     raise InvalidResponseClass(
                         f"Class: {return_class.__name__} does not inherit from Response class."
@@ -569,10 +885,11 @@ class Nebula:
 
                 new_route = Route(rule, method, view_func, return_class)
                 new_route.is_async = is_async
+                new_route.threaded = options.get("threaded", True)
+                new_route.etag = options.get("etag")
+                new_route.max_body_size = options.get("max_body_size")
 
-                self.routes.append(new_route)
-
-            self._rebuild_route_index()
+                self._add_route(new_route)
 
     async def internal_error_handler(self, code: int): # basic handler for HTTP 500
         return HTMLResponse(self.INTERNAL_ERROR, status_code=code)
@@ -583,6 +900,9 @@ class Nebula:
     async def content_not_found_handler(self, code: int): # basic handler for HTTP 404
         return HTMLResponse(self.NOT_FOUND, status_code=code)
 
+    async def payload_too_large_handler(self, code: int): # basic handler for HTTP 413
+        return HTMLResponse(self.PAYLOAD_TOO_LARGE, status_code=code)
+
     def error_handler(self, http_code: int):
         if not (400 <= http_code <= 599):
             raise InvalidHTTPErrorCode(
@@ -736,6 +1056,35 @@ def run_prod(
         **kwargs
     )
 
+def _head_send(send: callable) -> callable:
+    """Wrap send so a HEAD response keeps its headers but never sends a body."""
+    async def head_send(message):
+        if message["type"] == "http.response.body":
+            if message.get("more_body", False):
+                return
+            message = {"type": "http.response.body", "body": b"", "more_body": False}
+        await send(message)
+
+    return head_send
+
+def _track_start(send: callable) -> tuple[callable, callable]:
+    """Wrap send; the second callable tells whether the response has started."""
+    started = False
+
+    async def tracking_send(message):
+        nonlocal started
+        if message["type"] == "http.response.start":
+            started = True
+        await send(message)
+
+    return tracking_send, lambda: started
+
+def _is_multipart(scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == b"content-type":
+            return value.startswith(b"multipart/form-data")
+    return False
+
 class SyncJSONMiddleware(BaseMiddleware):
     def __init__(self, app):
         super().__init__(app)
@@ -745,17 +1094,27 @@ class SyncJSONMiddleware(BaseMiddleware):
 
         method = scope.get("method", "").upper()
         
-        # Only attempt to read body for methods that typically have one
-        if method in ["POST", "PUT", "PATCH"]:
-            body = b""
+        # Only attempt to read body for methods that typically have one.
+        # Multipart uploads are left to the streaming form parser.
+        if method in ["POST", "PUT", "PATCH"] and not _is_multipart(scope):
+            limit = get_request().max_body_size if has_request() else None
+            chunks = []
+            received = 0
             more = True
 
             while more:
                 msg = await receive()
-                if msg["type"] == "http.request":
-                    body += msg.get("body", b"")
-                    more = msg.get("more_body", False)
-
+                if msg["type"] != "http.request":
+                    break
+                chunk = msg.get("body", b"")
+                received += len(chunk)
+                if limit is not None and received > limit:
+                    raise PayloadTooLarge()
+                chunks.append(chunk)
+                more = msg.get("more_body", False)
+
+            # One join instead of repeated concatenation
+            body = b"".join(chunks)
             scope["_body"] = body
 
             async def new_receive():
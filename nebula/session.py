@@ -2,36 +2,222 @@ import orjson
 import hmac
 import hashlib
 import base64
-from typing import Any, Optional
+import secrets
+from binascii import b2a_base64
+import time
+from typing import Any, Callable, Optional, Sequence, Tuple, Union
+from nebula.cache import CacheBackend, MemoryBackend, MISSING
 from nebula.response import Response
 
+_SIGNATURE_LENGTH = 43  # unpadded base64url of a SHA-256 digest
+_LEGACY_SIGNATURE_LENGTH = 64  # hex digest of the old payload.signature format
+_URLSAFE = bytes.maketrans(b"+/", b"-_")
+_IMMUTABLE = frozenset((str, bytes, int, float, bool, type(None), tuple, frozenset))
+_IPAD = bytes(x ^ 0x36 for x in range(256))
+_OPAD = bytes(x ^ 0x5C for x in range(256))
+_USER_ID_KEY = "_user_id"
+
+
+class _KeyedHMAC:
+    """HMAC-SHA256 with the keyed inner and outer states computed once.
+
+    Signing copies two hash states instead of hashing the padded key twice
+    per call; the result is identical to ``hmac.new(key, msg, sha256)``.
+    """
+
+    __slots__ = ("_inner", "_outer")
+
+    def __init__(self, key: bytes):
+        if len(key) > 64:  # SHA-256 block size, RFC 2104 hashes longer keys
+            key = hashlib.sha256(key).digest()
+        key = key.ljust(64, b"\0")
+        self._inner = hashlib.sha256(key.translate(_IPAD))
+        self._outer = hashlib.sha256(key.translate(_OPAD))
+
+    def digest(self, msg: bytes) -> bytes:
+        inner = self._inner.copy()
+        inner.update(msg)
+        outer = self._outer.copy()
+        outer.update(inner.digest())
+        return outer.digest()
 
 
 class Session(dict):
-    """Cookie-based session dictionary that tracks modifications."""
+    """Cookie-based session dictionary that tracks modifications.
+
+    Assigning a value equal to the stored one (same type, ``==``) does not
+    count as a change. Re-assigning the very same object does, since it may
+    have been mutated in place. ``refresh`` asks the manager to re-issue the
+    cookie even without changes (key rotation, sliding expiry).
+    """
 
     modified: bool = False
+    refresh: bool = False
+    payload: Optional[str] = None  # encoded form the session was loaded from
 
     def __setitem__(self, key: str, value: Any) -> None:
-        self.modified = True
+        current = dict.get(self, key, MISSING)
+        if current is value:
+            # The same list/dict may have been changed in place
+            if type(value) not in _IMMUTABLE:
+                self.modified = True
+        elif current is MISSING or type(current) is not type(value) or current != value:
+            self.modified = True
         super().__setitem__(key, value)
 
     def __delitem__(self, key: str) -> None:
-        self.modified = True
         super().__delitem__(key)
+        self.modified = True
 
     def clear(self) -> None:
-        self.modified = True
+        if dict.__len__(self):
+            self.modified = True
         super().clear()
 
     def pop(self, key: str, *args) -> Any:
-        self.modified = True
+        if dict.__contains__(self, key):
+            self.modified = True
         return super().pop(key, *args)
 
+    def popitem(self):
+        item = super().popitem()
+        self.modified = True
+        return item
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
     def update(self, *args, **kwargs) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+
+class ServerSideSession(Session):
+    """Session whose data is fetched from the store on first access.
+
+    ``sid`` is the session ID from the cookie, None for a new session. The
+    ``loader`` runs at most once, the first time the session is read or
+    written; a request that never touches the session never hits the store.
+    """
+
+    regenerate_id: bool = False
+    stored_user_id: Any = None  # logged-in user ID as loaded, to spot logins
+
+    def __init__(self, sid: Optional[str] = None, loader: Optional[Callable[[], Any]] = None):
+        super().__init__()
+        self.sid = sid
+        self._loader = loader
+
+    @property
+    def loaded(self) -> bool:
+        return self._loader is None
+
+    def load(self) -> None:
+        """Fetch the data from the store now instead of on first access."""
+        self._load()
+
+    def regenerate(self) -> None:
+        """Move the data to a new session ID when saved.
+
+        Logins and logouts do this automatically; call it after any other
+        privilege change.
+        """
+        self._load()
+        self.regenerate_id = True
         self.modified = True
+
+    def _load(self) -> None:
+        loader = self._loader
+        if loader is None:
+            return
+        self._loader = None
+        data = loader()
+        if data is MISSING:
+            # Expired or evicted: start over under a fresh ID
+            self.sid = None
+        elif data:
+            dict.update(self, data)
+            self.stored_user_id = data.get(_USER_ID_KEY)
+
+    def __getitem__(self, key: str) -> Any:
+        self._load()
+        return super().__getitem__(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        self._load()
+        return super().get(key, default)
+
+    def __contains__(self, key: object) -> bool:
+        self._load()
+        return super().__contains__(key)
+
+    def __iter__(self):
+        self._load()
+        return super().__iter__()
+
+    def __len__(self) -> int:
+        self._load()
+        return super().__len__()
+
+    def keys(self):
+        self._load()
+        return super().keys()
+
+    def values(self):
+        self._load()
+        return super().values()
+
+    def items(self):
+        self._load()
+        return super().items()
+
+    def copy(self) -> dict:
+        self._load()
+        return dict(super().items())
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        self._load()
+        return super().setdefault(key, default)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._load()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        self._load()
+        super().__delitem__(key)
+
+    def pop(self, key: str, *args) -> Any:
+        self._load()
+        return super().pop(key, *args)
+
+    def popitem(self):
+        self._load()
+        return super().popitem()
+
+    def update(self, *args, **kwargs) -> None:
+        self._load()
         super().update(*args, **kwargs)
 
+    def clear(self) -> None:
+        # Nothing to fetch when the result is empty anyway, but the stored
+        # entry has to go
+        if self._loader is not None:
+            self._loader = None
+            self.modified = True
+        super().clear()
+
+    def __eq__(self, other: object) -> bool:
+        self._load()
+        return super().__eq__(other)
+
+    def __repr__(self) -> str:
+        if self._loader is not None:
+            return f"ServerSideSession(sid={self.sid!r}, <not loaded>)"
+        return f"ServerSideSession({dict.__repr__(self)})"
+
 
 class UserMixin:
     """Mixin for user model classes to work with the session system.
@@ -73,57 +259,148 @@ class AnonymousUser:
 
 
 class SecureCookieSessionManager:
-    """Manages HMAC-signed cookie-based sessions."""
+    """Manages HMAC-signed cookie-based sessions.
+
+    Cookies look like ``payload.timestamp.signature``: the signature is a
+    base64url HMAC-SHA256 over ``payload.timestamp``, the timestamp (hex
+    seconds) lets expired cookies be rejected before anything is decoded.
+    ``secret_key`` may be a list for key rotation: the first key signs,
+    older ones are only tried when the first doesn't match.
+
+    With ``sliding=True`` an unchanged session is re-issued once more than
+    ``refresh_fraction`` of ``max_age`` has passed since its cookie was
+    signed, so active users stay logged in without a Set-Cookie on every
+    response.
+    """
 
-    _USER_ID_KEY = "_user_id"
+    _USER_ID_KEY = _USER_ID_KEY
+    blocking = False  # save_session() never waits on I/O
 
     def __init__(
         self,
-        secret_key: str,
+        secret_key: Union[str, bytes, Sequence[Union[str, bytes]]],
         cookie_name: str = "nebula_session",
         max_age: int = 86400,
         secure: bool = False,
+        sliding: bool = False,
+        refresh_fraction: float = 0.5,
+        accept_legacy: bool = True,
     ):
-        self.secret_key = (
-            secret_key.encode() if isinstance(secret_key, str) else secret_key
-        )
+        if not 0 <= refresh_fraction <= 1:
+            raise ValueError("refresh_fraction must be between 0 and 1.")
+
+        keys = [secret_key] if isinstance(secret_key, (str, bytes)) else list(secret_key)
+        if not keys:
+            raise ValueError("At least one secret key is required.")
+
+        keys = [key.encode() if isinstance(key, str) else key for key in keys]
+        self.secret_key = keys[0]
+        self.fallback_keys = keys[1:]
+        self._hmacs = [_KeyedHMAC(key) for key in keys]
         self.cookie_name = cookie_name
         self.max_age = max_age
         self.secure = secure
+        self.sliding = sliding
+        self.refresh_fraction = refresh_fraction
+        self._refresh_after = max_age * refresh_fraction if sliding else None
+        self.accept_legacy = accept_legacy
+
+    @staticmethod
+    def _signature(mac: _KeyedHMAC, data: bytes) -> str:
+        # base64url without padding; b2a_base64 skips base64's Python-level wrapper
+        return b2a_base64(mac.digest(data), newline=False).translate(_URLSAFE)[:-1].decode()
 
     def _sign(self, data: str) -> str:
-        sig = hmac.new(self.secret_key, data.encode(), hashlib.sha256).hexdigest()
-        return f"{data}.{sig}"
+        signed = f"{data}.{int(time.time()):x}"
+        return f"{signed}.{self._signature(self._hmacs[0], signed.encode())}"
+
+    def _unsign(self, signed: str) -> Tuple[Optional[str], bool]:
+        """Return ``(data, reissue)``; data is None for a bad or expired cookie.
+
+        ``reissue`` is True when an older key matched or, with sliding
+        expiry, the cookie is due for a refresh.
+        """
+        signed_part, _, sig = signed.rpartition(".")
+        if len(sig) != _SIGNATURE_LENGTH:
+            if len(sig) == _LEGACY_SIGNATURE_LENGTH and self.accept_legacy:
+                return self._unsign_legacy(signed_part, sig)
+            return None, False
+        data, _, stamp = signed_part.rpartition(".")
+
+        try:
+            age = time.time() - int(stamp, 16)
+        except ValueError:
+            return None, False
+        if age > self.max_age or not data:
+            return None, False
+
+        message = signed_part.encode()
+        signature = self._signature
+        hmacs = self._hmacs
+        if hmac.compare_digest(sig, signature(hmacs[0], message)):
+            refresh_after = self._refresh_after
+            return data, refresh_after is not None and age >= refresh_after
+        for base in hmacs[1:]:
+            if hmac.compare_digest(sig, signature(base, message)):
+                return data, True
+        return None, False
+
+    def _unsign_legacy(self, data: str, sig: str) -> Tuple[Optional[str], bool]:
+        """Verify a ``data.hexsig`` cookie from before timestamps and base64url
+        signatures; a match is always re-issued in the current format."""
+        if not data:
+            return None, False
+        message = data.encode()
+        for key in (self.secret_key, *self.fallback_keys):
+            if hmac.compare_digest(sig, hmac.new(key, message, hashlib.sha256).hexdigest()):
+                return data, True
+        return None, False
+
+    def due_for_refresh(self, request) -> bool:
+        """Sliding expiry: True once the cookie is old enough to be re-issued.
+
+        Reads only the timestamp, so requests that never touch the session
+        still slide without verifying or decoding it on every hit.
+        """
+        refresh_after = self._refresh_after
+        if refresh_after is None:
+            return False
+        cookie = request.cookies.get(self.cookie_name)
+        if not cookie:
+            return False
+        stamp = cookie.rpartition(".")[0].rpartition(".")[2]
+        try:
+            return time.time() - int(stamp, 16) >= refresh_after
+        except ValueError:
+            return False
 
     def _verify(self, signed: str) -> Optional[str]:
+        return self._unsign(signed)[0]
+
+    def _decode_payload(self, payload: str) -> Optional[Session]:
         try:
-            data, sig = signed.rsplit(".", 1)
-            expected = hmac.new(
-                self.secret_key, data.encode(), hashlib.sha256
-            ).hexdigest()
-            if hmac.compare_digest(sig, expected):
-                return data
-        except Exception:
-            pass
-        return None
+            padded = payload + "=" * (-len(payload) % 4)
+            data = orjson.loads(base64.urlsafe_b64decode(padded.encode()))
+        except ValueError:
+            return None
+        return Session(data) if isinstance(data, dict) else None
 
     def _decode_cookie(self, cookie_value: str) -> Optional[Session]:
         verified = self._verify(cookie_value)
         if verified:
-            try:
-                padded = verified + "=" * (-len(verified) % 4)
-                raw = base64.urlsafe_b64decode(padded.encode()).decode()
-                return Session(orjson.loads(raw))
-            except Exception:
-                pass
+            return self._decode_payload(verified)
         return None
 
     def open_session(self, request) -> Session:
         cookie = request.cookies.get(self.cookie_name)
         if cookie:
-            session = self._decode_cookie(cookie)
-            if session is not None:
-                return session
+            payload, reissue = self._unsign(cookie)
+            if payload:
+                session = self._decode_payload(payload)
+                if session is not None:
+                    session.payload = payload
+                    session.refresh = reissue
+                    return session
         return Session()
 
     def save_session(self, session: Session, response: Response) -> None:
@@ -132,6 +409,10 @@ class SecureCookieSessionManager:
             .decode()
             .rstrip("=")
         )
+        if payload == session.payload and not session.refresh:
+            # Changed and changed back, the cookie the client has is still right
+            return
+
         signed = self._sign(payload)
         
         response.add_header("set-cookie", (
@@ -140,4 +421,79 @@ class SecureCookieSessionManager:
         ))
 
 
+class ServerSideSessionManager(SecureCookieSessionManager):
+    """Keeps session data in a store, the cookie only carries a signed session ID.
+
+    ``store`` is any `nebula.cache` backend: `MemoryBackend` (the default,
+    in-process), `SQLiteBackend` (shared between worker processes on one
+    host) or `RedisBackend`. Entries expire after ``max_age`` seconds.
 
+    The session ID changes whenever the logged-in user ID does, and on
+    `ServerSideSession.regenerate()`, so an ID handed out before login is
+    worthless afterwards.
+    """
+
+    _KEY_PREFIX = "nebula:session:"
+
+    def __init__(
+        self,
+        secret_key: Union[str, bytes, Sequence[Union[str, bytes]]],
+        store: Optional[CacheBackend] = None,
+        cookie_name: str = "nebula_session",
+        max_age: int = 86400,
+        secure: bool = False,
+        sliding: bool = False,
+        refresh_fraction: float = 0.5,
+    ):
+        # The old cookie format never held session IDs
+        super().__init__(secret_key, cookie_name, max_age, secure, sliding, refresh_fraction, accept_legacy=False)
+        self.store = store if store is not None else MemoryBackend(max_size=100_000)
+
+    @property
+    def blocking(self) -> bool:
+        return self.store.blocking
+
+    def _load(self, sid: str) -> Any:
+        return self.store.get(self._KEY_PREFIX + sid, MISSING)
+
+    def open_session(self, request) -> ServerSideSession:
+        cookie = request.cookies.get(self.cookie_name)
+        if cookie:
+            sid, reissue = self._unsign(cookie)
+            if sid:
+                # Only the signature is checked here, the store is hit on first use
+                session = ServerSideSession(sid, lambda: self._load(sid))
+                session.refresh = reissue
+                return session
+        return ServerSideSession()
+
+    def save_session(self, session: ServerSideSession, response: Response) -> None:
+        data = session.copy()
+
+        if not data:
+            # Emptied (e.g. logout): drop the entry and expire the cookie
+            if session.sid is not None:
+                self.store.delete(self._KEY_PREFIX + session.sid)
+                response.add_header("set-cookie", (
+                    f"{self.cookie_name}=; Path=/; Max-Age=0; HttpOnly;"
+                    f"{' Secure;' if self.secure else ''} SameSite=Lax"
+                ))
+            return
+
+        if session.sid is not None and (
+            session.regenerate_id or data.get(self._USER_ID_KEY) != session.stored_user_id
+        ):
+            # Never carry an ID across a login or logout (session fixation)
+            self.store.delete(self._KEY_PREFIX + session.sid)
+            session.sid = None
+            session.regenerate_id = False
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        self.store.set(self._KEY_PREFIX + session.sid, data, ttl=self.max_age)
+        session.stored_user_id = data.get(self._USER_ID_KEY)
+
+        response.add_header("set-cookie", (
+            f"{self.cookie_name}={self._sign(session.sid)}; Path=/; Max-Age={self.max_age}; HttpOnly;"
+            f"{' Secure;' if self.secure else ''} SameSite=Lax"
+        ))
@@ -0,0 +1,362 @@
+import mimetypes
+import os
+import stat
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .concurrency import ThreadPool, run_in_threadpool
+from .middleware import negotiate_encoding
+from .response import FileResponse, HTMLResponse, Response
+from .types import DEFAULT_404_BODY
+
+PRECOMPRESSED_SUFFIXES = (("br", ".br"), ("gzip", ".gz"))
+
+
+class CachedAsset:
+    """A small static file kept in memory with its headers pre-encoded."""
+
+    __slots__ = ("path", "body", "headers", "not_modified_headers", "etag", "mtime", "mtime_ns", "size", "checked_at")
+
+    def __init__(
+        self,
+        path: Path,
+        body: bytes,
+        st: os.stat_result,
+        media_type: str,
+        extra_headers: Optional[Dict[str, str]] = None,
+    ):
+        self.path = path
+        self.body = body
+        self.mtime = st.st_mtime
+        self.mtime_ns = st.st_mtime_ns
+        self.size = st.st_size
+        self.etag = FileResponse.make_etag(st)
+        self.checked_at = time.monotonic()
+
+        validators = [
+            (b"etag", self.etag.encode("latin-1")),
+            (b"last-modified", formatdate(st.st_mtime, usegmt=True).encode("latin-1")),
+        ]
+        extra = [
+            (k.lower().encode("latin-1"), v.encode("latin-1"))
+            for k, v in (extra_headers or {}).items()
+        ]
+
+        self.not_modified_headers = extra + validators
+        self.headers = extra + validators + [
+            (b"accept-ranges", b"bytes"),
+            (b"content-type", media_type.encode("latin-1")),
+            (b"content-length", str(len(body)).encode("latin-1")),
+        ]
+
+    def respond(self, request) -> Response:
+        headers = request.headers
+        if FileResponse.not_modified(
+            headers.get("if-none-match"), headers.get("if-modified-since"), self.etag, self.mtime
+        ):
+            return Response.from_encoded(b"", 304, self.not_modified_headers)
+
+        return Response.from_encoded(self.body, 200, self.headers)
+
+
+class StaticAssetCache:
+    """In-memory LRU cache of small static files, bounded by total bytes.
+
+    Hits skip the exists / is_file / guess_type / open / read sequence and
+    reuse pre-encoded headers. Freshness is checked with a single os.stat()
+    per entry at most every ``check_interval`` seconds; a changed mtime or
+    size (or a deleted file) evicts the entry.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 16 * 1024 * 1024,
+        max_file_size: int = 256 * 1024,
+        check_interval: float = 1.0,
+    ):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.check_interval = check_interval
+
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, CachedAsset]" = OrderedDict()
+
+    def admits(self, size: int) -> bool:
+        return size <= self.max_file_size and size <= self.max_bytes
+
+    def get(self, key: tuple) -> Optional[CachedAsset]:
+        asset = self._entries.get(key)
+        if asset is None:
+            self.misses += 1
+            return None
+
+        now = time.monotonic()
+        if now - asset.checked_at >= self.check_interval:
+            try:
+                st = os.stat(asset.path)
+            except OSError:
+                st = None
+            if st is None or st.st_mtime_ns != asset.mtime_ns or st.st_size != asset.size:
+                self._evict(key)
+                self.misses += 1
+                return None
+            asset.checked_at = now
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return asset
+
+    def put(self, key: tuple, asset: CachedAsset) -> None:
+        if key in self._entries:
+            self._evict(key)
+
+        self._entries[key] = asset
+        self.total_bytes += len(asset.body)
+
+        while self.total_bytes > self.max_bytes:
+            old_key = next(iter(self._entries))
+            self._evict(old_key)
+
+    def _evict(self, key: tuple) -> None:
+        asset = self._entries.pop(key)
+        self.total_bytes -= len(asset.body)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ManifestEntry:
+    """What a static file looked like when the manifest was built."""
+
+    __slots__ = ("path", "size", "mtime", "media_type", "etag", "stat_result")
+
+    def __init__(self, path: Path, st: os.stat_result, media_type: str):
+        self.path = path
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.media_type = media_type
+        self.etag = FileResponse.make_etag(st)
+        self.stat_result = st
+
+
+class StaticManifest:
+    """Immutable map of relative path -> ManifestEntry, built by one scan.
+
+    Lookups are a dict hit on the request path as given, so nothing outside
+    the scanned tree can ever be addressed, and unknown paths cost zero
+    syscalls. Call reload() after swapping assets on disk; the new map
+    replaces the old one in a single assignment.
+    """
+
+    __slots__ = ("directory", "_entries")
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._entries: Dict[str, ManifestEntry] = {}
+        self.reload()
+
+    def reload(self) -> None:
+        entries: Dict[str, ManifestEntry] = {}
+        root = str(self.directory)
+
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                full = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(full)
+                except OSError:
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+
+                relative = os.path.relpath(full, root).replace(os.sep, "/")
+                media_type, _ = mimetypes.guess_type(relative)
+                entries[relative] = ManifestEntry(
+                    Path(full), st, media_type or "application/octet-stream"
+                )
+
+        self._entries = entries
+
+    def get(self, relative: str) -> Optional[ManifestEntry]:
+        return self._entries.get(relative)
+
+    def __contains__(self, relative: str) -> bool:
+        return relative in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _read_bytes(path: Path) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class StaticFiles:
+    """Serve files below ``directory`` for the static route.
+
+    Registered by init_static_serving(); the instance is kept on
+    ``app.static_files``.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        thread_pool: Optional[ThreadPool] = None,
+        precompressed: bool = True,
+        asset_cache: Optional[StaticAssetCache] = None,
+        manifest: bool = False,
+    ):
+        self.directory = Path(directory)
+        self.thread_pool = thread_pool
+        self.precompressed = precompressed
+        self.asset_cache = asset_cache
+        self.manifest = StaticManifest(self.directory) if manifest else None
+
+    def reload(self) -> None:
+        """Rescan the manifest and drop cached assets after a deployment."""
+        if self.manifest is not None:
+            self.manifest.reload()
+        if self.asset_cache is not None:
+            self.asset_cache.clear()
+
+    async def _run(self, func, *args):
+        if self.thread_pool is not None:
+            return await self.thread_pool.run(func, *args)
+        return await run_in_threadpool(func, *args)
+
+    @staticmethod
+    def _normalize(path: str) -> Optional[str]:
+        # Lexical check only, no syscalls: reject anything escaping the root
+        relative = os.path.normpath(path)
+        if relative.startswith("..") or os.path.isabs(relative) or "\x00" in relative:
+            return None
+        return relative
+
+    def _accepted_encodings(self, request) -> Tuple[str, ...]:
+        if not self.precompressed:
+            return ()
+
+        accept_encoding = request.headers.get("accept-encoding", "")
+        if not accept_encoding:
+            return ()
+
+        return tuple(
+            encoding for encoding, _ in PRECOMPRESSED_SUFFIXES
+            if negotiate_encoding(accept_encoding, (encoding,)) is not None
+        )
+
+    async def _stat_file(self, path: Path) -> Optional[os.stat_result]:
+        try:
+            st = await self._run(os.stat, path)
+        except OSError:
+            return None
+        return st if stat.S_ISREG(st.st_mode) else None
+
+    async def _locate(
+        self, relative: str, accepted: Tuple[str, ...]
+    ) -> Optional[Tuple[Path, os.stat_result, Optional[Dict[str, str]], str]]:
+        """Find the file to send: a precompressed sibling if accepted, else the original."""
+        file_path = self.directory / relative
+
+        st = await self._stat_file(file_path)
+        if st is None:
+            return None
+
+        # Detect MIME type
+        media_type, _ = mimetypes.guess_type(relative)
+        media_type = media_type or "application/octet-stream"  # fallback
+
+        # Prefer a .br / .gz sibling built at deploy time over compressing per request
+        for encoding, suffix in PRECOMPRESSED_SUFFIXES:
+            if encoding not in accepted:
+                continue
+            sibling = file_path.with_name(file_path.name + suffix)
+            sibling_st = await self._stat_file(sibling)
+            if sibling_st is not None:
+                headers = {"content-encoding": encoding, "vary": "Accept-Encoding"}
+                return sibling, sibling_st, headers, media_type
+
+        return file_path, st, None, media_type
+
+    def _locate_in_manifest(
+        self, relative: str, accepted: Tuple[str, ...]
+    ) -> Optional[Tuple[Path, os.stat_result, Optional[Dict[str, str]], str]]:
+        manifest = self.manifest
+        entry = manifest.get(relative)
+        if entry is None:
+            return None
+
+        for encoding, suffix in PRECOMPRESSED_SUFFIXES:
+            if encoding not in accepted:
+                continue
+            sibling = manifest.get(relative + suffix)
+            if sibling is not None:
+                headers = {"content-encoding": encoding, "vary": "Accept-Encoding"}
+                return sibling.path, sibling.stat_result, headers, entry.media_type
+
+        return entry.path, entry.stat_result, None, entry.media_type
+
+    async def __call__(self, request, path: str) -> Response:
+        if self.manifest is not None:
+            # Only scanned paths exist; no normalisation or syscalls needed
+            relative = path
+            if relative not in self.manifest:
+                return HTMLResponse(DEFAULT_404_BODY, status_code=404)
+        else:
+            relative = self._normalize(path)
+            if relative is None:
+                return HTMLResponse(DEFAULT_404_BODY, status_code=404)
+
+        accepted = self._accepted_encodings(request)
+        cache = self.asset_cache
+        # Range requests are rare and served straight from disk
+        use_cache = cache is not None and "range" not in request.headers
+
+        key = (relative, accepted)
+        if use_cache:
+            asset = cache.get(key)
+            if asset is not None:
+                return asset.respond(request)
+
+        if self.manifest is not None:
+            located = self._locate_in_manifest(relative, accepted)
+        else:
+            located = await self._locate(relative, accepted)
+        if located is None:
+            return HTMLResponse(DEFAULT_404_BODY, status_code=404)
+
+        file_path, st, extra_headers, mime_type = located
+
+        if use_cache and cache.admits(st.st_size):
+            body = await self._run(_read_bytes, file_path)
+            asset = CachedAsset(file_path, body, st, mime_type, extra_headers)
+            cache.put(key, asset)
+            return asset.respond(request)
+
+        # Streamed off-loop in chunks, with ETag / 304 / Range handling
+        return FileResponse(
+            file_path,
+            media_type=mime_type,
+            stat_result=st,
+            headers=extra_headers,
+            thread_pool=self.thread_pool,
+        )
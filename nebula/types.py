@@ -1,4 +1,12 @@
-AVAILABLE_METHODS = ["GET", "POST", "PUT", "DELETE"]
+from typing import Any, Awaitable, Callable, MutableMapping
+
+# scope, receive, send -> awaitable, what every middleware and route chain is
+ASGIApp = Callable[
+    [MutableMapping[str, Any], Callable[[], Awaitable[dict]], Callable[[dict], Awaitable[None]]],
+    Awaitable[None],
+]
+
+AVAILABLE_METHODS = ["GET", "POST", "PUT", "DELETE", "PATCH", "HEAD", "OPTIONS"]
 
 DEFAULT_TEMPLATES_DIR = "templates"
 DEFAULT_STATICS_DIR = "statics"
@@ -22,6 +30,15 @@ DEFAULT_500_BODY = """
     </body>
 """
 
+DEFAULT_413_BODY = """
+    <head><title>413 Payload Too Large</title></head>
+
+    <body>
+        <h1>Payload Too Large</h1>
+        <p>The request body is larger than the server is willing to accept.</p>
+    </body>
+"""
+
 DEFAULT_405_BODY = """
     <head><title>405 Method Not Allowed</title></head>
 
@@ -1,11 +1,13 @@
 from typing import Optional
 from pathlib import Path 
 from jinja2 import Environment , FileSystemLoader
-from ..response import Response, HTMLResponse
-from ..types import DEFAULT_404_BODY
-import mimetypes
+from ..staticfiles import StaticFiles, StaticAssetCache
 
-def init_static_serving(app, endpoint: str = "static", static_dir: Optional[str] = None) -> None:
+def init_static_serving(
+    app, endpoint: str = "static", static_dir: Optional[str] = None,
+    precompressed: bool = True, asset_cache: Optional[StaticAssetCache] = None,
+    manifest: bool = False
+) -> None:
     if static_dir:
         resolved_static_dir = Path(static_dir)
         if not resolved_static_dir.is_absolute():
@@ -13,25 +15,19 @@ def init_static_serving(app, endpoint: str = "static", static_dir: Optional[str]
     else:
         resolved_static_dir = Path(app.module_name).resolve().parent / "statics"
     app.statics_dir = resolved_static_dir
-        
 
-    @app.route(f"/{endpoint}/" + "{path}")
-    async def serve_file(request, path):
-        file_path = app.statics_dir / path
-
-        if not file_path.exists() or not file_path.is_file():
-            return HTMLResponse(DEFAULT_404_BODY, status_code=404)
-
-        # Detect MIME type
-        mime_type, _ = mimetypes.guess_type(str(file_path))
-        mime_type = mime_type or "application/octet-stream"  # fallback
+    static_files = StaticFiles(
+        resolved_static_dir,
+        thread_pool=app.thread_pool,
+        precompressed=precompressed,
+        asset_cache=asset_cache,
+        manifest=manifest,
+    )
+    app.static_files = static_files
 
-        # Read file content
-        with open(file_path, "rb") as f:  # read as bytes
-            content = f.read()
-
-        # Return response with Content-Type
-        return Response(content, media_type=mime_type)
+    @app.route(f"/{endpoint}/" + "{path:path}")
+    async def serve_file(request, path):
+        return await static_files(request, path)
 
     return 
 
@@ -15,7 +15,7 @@ class ASGIResponse:
         self.status_code = status_code
         self.headers = {k.decode(): v.decode() for k, v in headers}
         self.body = body
-        self.text = body.decode()
+        self.text = body.decode(errors="replace")
     
     def json(self):
         return json.loads(self.text)
@@ -272,4 +272,368 @@ async def test_multiple_group_middlewares(app, client):
     resp = await client.get("/multi-group/test")
     assert resp.status_code == 200
     assert resp.headers.get('x-group-1') == 'val1'
-    assert resp.headers.get('x-group-2') == 'val2'
\ No newline at end of file
+    assert resp.headers.get('x-group-2') == 'val2'
+@pytest.mark.asyncio
+async def test_middleware_chain_built_once_per_route(app, client):
+    built = []
+
+    class CountingMiddleware(BaseMiddleware):
+        def __init__(self, app, name):
+            super().__init__(app)
+            built.append(name)
+
+    app.add_middleware(Middleware(CountingMiddleware, name="global"))
+
+    @app.route("/counted", route_middlewares=[Middleware(CountingMiddleware, name="route")])
+    async def counted():
+        return PlainTextResponse("OK")
+
+    for _ in range(3):
+        resp = await client.get("/counted")
+        assert resp.status_code == 200
+
+    # The global stack wraps routing once, the route stack wraps its endpoint
+    assert built == ["global", "route"]
+
+@pytest.mark.asyncio
+async def test_global_middleware_can_rewrite_path_before_routing(app, client):
+    class StripPrefix(BaseMiddleware):
+        async def __call__(self, scope, receive, send):
+            if scope["type"] == "http" and scope["path"].startswith("/api/"):
+                scope = dict(scope, path=scope["path"][4:])
+            await self.app(scope, receive, send)
+
+    app.add_middleware(Middleware(StripPrefix))
+
+    @app.get("/items")
+    async def items(req: Request):
+        return PlainTextResponse(req.path)
+
+    @app.get("/users/{uid:int}")
+    async def user(uid: int):
+        return PlainTextResponse(str(uid))
+
+    resp = await client.get("/api/items")
+    assert resp.status_code == 200
+    assert resp.text == "/items"
+    assert (await client.get("/api/users/3")).text == "3"
+    assert (await client.get("/api/missing")).status_code == 404
+
+@pytest.mark.asyncio
+async def test_global_middleware_runs_on_404(app, client):
+    order_list = []
+    app.add_middleware(Middleware(OrderMiddleware, order_list=order_list, name="global"))
+
+    resp = await client.get("/missing")
+    assert resp.status_code == 404
+    assert resp.headers.get('x-order-global') == 'value-global'
+    assert order_list == ["before_global", "after_global"]
+
+@pytest.mark.asyncio
+async def test_add_middleware_recompiles_routes(app, client):
+    @app.route("/late")
+    async def late():
+        return PlainTextResponse("OK")
+
+    resp = await client.get("/late")
+    assert 'x-global-header' not in resp.headers
+
+    app.add_middleware(Middleware(GlobalHeaderMiddleware))
+
+    resp = await client.get("/late")
+    assert resp.headers.get('x-global-header') == 'global-value'
+
+@pytest.mark.asyncio
+async def test_compression_middleware_gzip(app, client):
+    import gzip
+    from nebula.middleware import CompressionMiddleware
+
+    app.add_middleware(Middleware(CompressionMiddleware, minimum_size=100))
+
+    @app.route("/big")
+    async def big():
+        return {"items": ["x" * 10] * 100}
+
+    @app.route("/small")
+    async def small():
+        return {"ok": True}
+
+    resp = await client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers.get("content-encoding") == "gzip"
+    assert resp.headers.get("vary") == "Accept-Encoding"
+    assert json.loads(gzip.decompress(resp.body)) == {"items": ["x" * 10] * 100}
+
+    resp = await client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in resp.headers
+    assert resp.json() == {"ok": True}
+
+    resp = await client.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in resp.headers
+
+@pytest.mark.asyncio
+async def test_compression_middleware_streaming(app, client):
+    import zlib
+    from nebula.middleware import CompressionMiddleware
+    from nebula.response import StreamingResponse
+
+    app.add_middleware(Middleware(CompressionMiddleware, minimum_size=10_000))
+
+    @app.route("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(5):
+                yield f"chunk {i}\n"
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    messages = []
+    scope = {
+        "type": "http", "method": "GET", "path": "/stream", "query_string": b"",
+        "headers": [(b"accept-encoding", b"gzip, deflate")],
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+
+    start = messages[0]
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+
+    bodies = [m for m in messages if m["type"] == "http.response.body"]
+    # Compressed chunk by chunk, not buffered into a single message
+    assert len(bodies) > 2
+    body = b"".join(m["body"] for m in bodies)
+    assert zlib.decompress(body, 31).decode() == "".join(f"chunk {i}\n" for i in range(5))
+
+def test_negotiate_encoding():
+    from nebula.middleware import negotiate_encoding
+
+    assert negotiate_encoding("gzip, br", ("br", "gzip")) == "br"
+    assert negotiate_encoding("br;q=0, gzip;q=0.5", ("br", "gzip")) == "gzip"
+    assert negotiate_encoding("*", ("gzip",)) == "gzip"
+    assert negotiate_encoding("identity", ("br", "gzip")) is None
+    assert negotiate_encoding("", ("gzip",)) is None
+
+@pytest.mark.asyncio
+async def test_response_cache_serves_hits_without_handler(app, client):
+    from nebula.cache import Cache
+    from nebula.middleware import ResponseCacheMiddleware
+
+    store = Cache()
+    app.add_middleware(Middleware(ResponseCacheMiddleware, cache=store, ttl=60, store_unmarked=True))
+    calls = []
+
+    @app.route("/cached")
+    async def cached_page():
+        calls.append(1)
+        return {"n": len(calls)}
+
+    @app.route("/private")
+    async def private_page():
+        calls.append(1)
+        return JSONResponse({"n": len(calls)}, headers={"Cache-Control": "private"})
+
+    first = await client.get("/cached")
+    second = await client.get("/cached")
+    assert first.json() == second.json() == {"n": 1}
+    assert second.headers["age"] == "0"
+    assert len(calls) == 1
+
+    # Request asking for a fresh copy goes through and refreshes the entry
+    third = await client.get("/cached", headers={"Cache-Control": "no-cache"})
+    assert third.json() == {"n": 2}
+    assert (await client.get("/cached")).json() == {"n": 2}
+
+    await client.get("/private")
+    await client.get("/private")
+    assert len(calls) == 4
+
+    store.clear()
+    assert (await client.get("/cached")).json() == {"n": 5}
+
+@pytest.mark.asyncio
+async def test_response_cache_stores_only_marked_responses(app, client):
+    from nebula.middleware import ResponseCacheMiddleware
+
+    app.add_middleware(Middleware(ResponseCacheMiddleware, ttl=60))
+    calls = []
+
+    @app.route("/plain")
+    async def plain():
+        calls.append(1)
+        return PlainTextResponse(str(len(calls)))
+
+    @app.route("/public")
+    async def public():
+        calls.append(1)
+        return PlainTextResponse(str(len(calls)), headers={"Cache-Control": "public"})
+
+    assert (await client.get("/plain")).text == "1"
+    assert (await client.get("/plain")).text == "2"
+    assert (await client.get("/public")).text == "3"
+    assert (await client.get("/public")).text == "3"
+
+@pytest.mark.asyncio
+async def test_response_cache_never_shares_session_pages(app, client):
+    from nebula.middleware import ResponseCacheMiddleware
+
+    app.setup_sessions("secret123")
+    app.add_middleware(Middleware(ResponseCacheMiddleware, ttl=60, store_unmarked=True))
+
+    @app.route("/login/{name}")
+    async def login(req: Request, name: str):
+        req.session["name"] = name
+        return PlainTextResponse("ok", headers={"Cache-Control": "no-store"})
+
+    @app.route("/me")
+    async def me(req: Request):
+        return PlainTextResponse(f"hello {req.session.get('name', 'guest')}", headers={"Cache-Control": "max-age=60"})
+
+    cookies = {}
+    for name in ("alice", "bob"):
+        resp = await client.get(f"/login/{name}")
+        cookies[name] = {"nebula_session": resp.headers["set-cookie"].split(";")[0].split("=", 1)[1]}
+
+    assert (await client.get("/me", cookies=cookies["alice"])).text == "hello alice"
+    assert (await client.get("/me", cookies=cookies["bob"])).text == "hello bob"
+    # Without a cookie the handler still opened the session, so nothing was stored
+    assert (await client.get("/me")).text == "hello guest"
+    assert (await client.get("/me", cookies=cookies["alice"])).text == "hello alice"
+
+@pytest.mark.asyncio
+async def test_response_cache_varies_on_declared_headers(app, client):
+    from nebula.middleware import ResponseCacheMiddleware
+
+    app.add_middleware(Middleware(ResponseCacheMiddleware))
+
+    @app.route("/lang")
+    async def lang(req: Request):
+        return PlainTextResponse(
+            req.headers.get("accept-language", "none"),
+            headers={"Vary": "Accept-Language", "Cache-Control": "max-age=30"},
+        )
+
+    assert (await client.get("/lang", headers={"Accept-Language": "fr"})).text == "fr"
+    assert (await client.get("/lang", headers={"Accept-Language": "de"})).text == "de"
+    hit = await client.get("/lang", headers={"Accept-Language": "fr"})
+    assert hit.text == "fr"
+    assert "age" in hit.headers
+
+@pytest.mark.asyncio
+async def test_response_cache_stale_while_revalidate(app, client):
+    from nebula.middleware import ResponseCacheMiddleware
+
+    app.add_middleware(Middleware(ResponseCacheMiddleware))
+    calls = []
+
+    @app.route("/swr")
+    async def swr():
+        calls.append(1)
+        return PlainTextResponse(
+            f"v{len(calls)}", headers={"Cache-Control": "max-age=0, stale-while-revalidate=60"}
+        )
+
+    assert (await client.get("/swr")).text == "v1"
+    # Stale: served from cache while a background request refreshes it
+    assert (await client.get("/swr")).text == "v1"
+    await asyncio.sleep(0.05)
+    assert len(calls) == 2
+    assert (await client.get("/swr")).text == "v2"
+
+@pytest.mark.asyncio
+async def test_response_cache_refresh_drops_credentials(app, client):
+    from nebula.middleware import ResponseCacheMiddleware
+
+    app.add_middleware(Middleware(ResponseCacheMiddleware))
+
+    @app.route("/greet")
+    async def greet(req: Request):
+        return PlainTextResponse(
+            f"hello {req.cookies.get('name', 'guest')}",
+            headers={"Cache-Control": "max-age=0, stale-while-revalidate=60"},
+        )
+
+    assert (await client.get("/greet")).text == "hello guest"
+    # A stale hit from a client with a cookie starts the refresh
+    assert (await client.get("/greet", cookies={"name": "alice-secret"})).text == "hello guest"
+    await asyncio.sleep(0.05)
+    assert (await client.get("/greet")).text == "hello guest"
+
+@pytest.mark.asyncio
+async def test_head_served_from_get_route(app, client):
+    calls = []
+
+    @app.get("/health")
+    async def health():
+        calls.append(1)
+        return {"status": "ok"}
+
+    resp = await client._request("HEAD", "/health")
+    assert resp.status_code == 200
+    assert resp.body == b""
+    assert resp.headers["content-length"] == str(len(b'{"status":"ok"}'))
+    assert calls == [1]
+
+    @app.route("/items", methods=["PATCH", "OPTIONS"])
+    async def items(req: Request):
+        return req.method
+
+    assert (await client._request("PATCH", "/items")).text == "PATCH"
+    assert (await client._request("OPTIONS", "/items")).text == "OPTIONS"
+    assert (await client._request("HEAD", "/items")).status_code == 405
+
+@pytest.mark.asyncio
+async def test_cors_headers_on_early_413(app, client):
+    app.setup_cors(allow_origins=["https://a.example"])
+
+    @app.post("/upload", max_body_size=10)
+    async def upload(req: Request):
+        return "ok"
+
+    resp = await client._request(
+        "POST", "/upload", body=b"x" * 100,
+        headers={"Origin": "https://a.example", "Content-Length": "100"},
+    )
+    assert resp.status_code == 413
+    assert resp.headers["access-control-allow-origin"] == "https://a.example"
+
+@pytest.mark.asyncio
+async def test_cors_preflight_uses_registered_methods(app, client):
+    app.setup_cors(allow_origins=["https://a.example"], allow_headers=["content-type"], max_age=60)
+    calls = []
+
+    @app.route("/users/{user_id:int}", methods=["GET", "DELETE"])
+    async def user(user_id: int):
+        calls.append(user_id)
+        return {"id": user_id}
+
+    preflight_headers = {
+        "Origin": "https://a.example",
+        "Access-Control-Request-Method": "DELETE",
+        "Access-Control-Request-Headers": "Content-Type",
+    }
+    resp = await client._request("OPTIONS", "/users/1", headers=preflight_headers)
+    assert resp.status_code == 204
+    assert resp.headers["access-control-allow-origin"] == "https://a.example"
+    assert resp.headers["access-control-allow-methods"] == "DELETE, GET, HEAD"
+    assert resp.headers["access-control-max-age"] == "60"
+    assert calls == []
+
+    resp = await client._request("OPTIONS", "/users/1", headers=dict(preflight_headers, **{"Access-Control-Request-Method": "PUT"}))
+    assert resp.status_code == 400
+
+    resp = await client._request("OPTIONS", "/users/1", headers=dict(preflight_headers, Origin="https://evil.example"))
+    assert resp.status_code == 400
+
+    resp = await client.get("/users/7", headers={"Origin": "https://a.example"})
+    assert resp.json() == {"id": 7}
+    assert resp.headers["access-control-allow-origin"] == "https://a.example"
+    assert resp.headers["vary"] == "Origin"
+
+    resp = await client.get("/users/7")
+    assert "access-control-allow-origin" not in resp.headers
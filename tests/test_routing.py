@@ -0,0 +1,94 @@
+import pytest
+
+from nebula.routing import Route, Router
+
+
+def handler():
+    return "ok"
+
+
+@pytest.fixture
+def router():
+    return Router([
+        Route("/", "GET", handler),
+        Route("/users", "GET", handler),
+        Route("/users/me", "GET", handler),
+        Route("/users/{user_id:int}", "GET", handler),
+        Route("/users/{user_id:int}", "DELETE", handler),
+        Route("/users/{name}", "GET", handler),
+        Route("/users/{user_id:int}/posts/{slug}", "GET", handler),
+    ])
+
+
+def test_router_static_route(router):
+    route, values, allowed = router.resolve("/users", "GET")
+    assert route.path_template == "/users"
+    assert values == {}
+    assert allowed == set()
+
+def test_router_root_route(router):
+    route, values, _ = router.resolve("/", "GET")
+    assert route.path_template == "/"
+
+def test_router_static_segment_beats_parameter(router):
+    route, values, _ = router.resolve("/users/me", "GET")
+    assert route.path_template == "/users/me"
+    assert values == {}
+
+def test_router_converts_params(router):
+    route, values, _ = router.resolve("/users/42/posts/hello", "GET")
+    assert route.path_template == "/users/{user_id:int}/posts/{slug}"
+    assert values == {"user_id": 42, "slug": "hello"}
+
+def test_router_backtracks_when_converter_rejects(router):
+    route, values, _ = router.resolve("/users/alice", "GET")
+    assert route.path_template == "/users/{name}"
+    assert values == {"name": "alice"}
+
+def test_router_method_not_allowed(router):
+    route, values, allowed = router.resolve("/users/42", "POST")
+    assert route is None
+    assert allowed == {"GET", "DELETE"}
+
+def test_router_not_found(router):
+    route, values, allowed = router.resolve("/nope/42", "GET")
+    assert route is None
+    assert allowed == set()
+
+def test_router_many_routes_resolve_last():
+    router = Router([Route(f"/r{i}/items/{{item_id:int}}", "GET", handler) for i in range(2000)])
+
+    route, values, _ = router.resolve("/r1999/items/7", "GET")
+    assert route.path_template == "/r1999/items/{item_id:int}"
+    assert values == {"item_id": 7}
+
+def test_router_trailing_path_param_captures_rest():
+    router = Router([
+        Route("/static/{path:path}", "GET", handler),
+        Route("/static/special", "GET", handler),
+    ])
+
+    route, values, _ = router.resolve("/static/css/site/main.css", "GET")
+    assert route.path_template == "/static/{path:path}"
+    assert values == {"path": "css/site/main.css"}
+
+    route, values, _ = router.resolve("/static/special", "GET")
+    assert route.path_template == "/static/special"
+
+    route, values, _ = router.resolve("/static", "GET")
+    assert route is None
+
+    route = Route("/static/{path:path}", "GET", handler)
+    assert route.match("/static/a/b.js", "GET") == {"path": "a/b.js"}
+
+def test_router_static_routes_match_exact_path(router):
+    route, _, allowed = router.resolve("/users/me/", "GET")
+    assert route.path_template == "/users/{name}"
+
+    route, _, allowed = router.resolve("//users", "GET")
+    assert route is None
+    assert allowed == set()
+
+    route, values, _ = router.resolve("/users/3/", "GET")
+    assert route.path_template == "/users/{user_id:int}"
+    assert values == {"user_id": 3}